@@ -0,0 +1,480 @@
+"""
+Clone Engine
+Copies a project's TypedContext hierarchy level by level (breadth-first).
+The source hierarchy is prefetched up front with a handful of paged
+projection queries, so the copy itself never lazy-loads source data.
+Every level is created in batched commits instead of one commit per entity,
+with custom attribute values written as operations of the same commit.
+Schema fallbacks to Folder are decided client-side from a SchemaLookup, so
+only a batch rejected by the server for another reason is retried one
+entity at a time.
+Independent top-level subtrees can be fanned out to a pool of worker
+threads, each owning its own ftrack session. With a CopyJournal attached,
+nodes that were already copied by an interrupted run are skipped.
+A copy can be cancelled between batches through a threading.Event.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+import ftrack_api
+
+from actions.custom_attributes import AttributeConfigurations
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of entities created per commit.
+DEFAULT_BATCH_SIZE = int(os.getenv('FTRACK_COPY_BATCH_SIZE', '200'))
+
+# Page size used by the prefetch queries (also the size of "id in (...)" chunks).
+PREFETCH_PAGE_SIZE = int(os.getenv('FTRACK_COPY_PREFETCH_PAGE_SIZE', '500'))
+
+# Number of worker sessions used to copy top-level subtrees in parallel.
+DEFAULT_WORKERS = int(os.getenv('FTRACK_COPY_WORKERS', '1'))
+MAX_WORKERS = 16
+
+# Seconds between progress checks while waiting on parallel workers.
+PROGRESS_INTERVAL = 1
+
+# Entity types whose children are never copied.
+LEAF_ENTITY_TYPES = ('Task', 'Milestone')
+
+# Server errors that make a batch fall back to per-entity commits.
+RECOVERABLE_ERRORS = ('DuplicateEntryError', 'ValidationError')
+
+
+class CopyCancelled(Exception):
+    """Raised inside a copy when its cancel event has been set."""
+
+
+class SourceNode:
+    """Plain-data snapshot of one source TypedContext entity."""
+
+    __slots__ = (
+        'id', 'name', 'entity_type', 'parent_id', 'object_type_id', 'sort',
+        'description', 'type_id', 'frames', 'custom_attributes',
+    )
+
+    def __init__(self, entity):
+        self.id = entity['id']
+        self.name = entity['name']
+        self.entity_type = entity.entity_type
+        self.parent_id = entity['parent_id']
+        self.object_type_id = entity['object_type_id']
+        self.sort = entity['sort']
+        self.description = entity['description']
+        self.type_id = None
+        self.frames = None
+        self.custom_attributes = {}
+
+
+class SourceIndex:
+    """In-memory tree of a prefetched source project."""
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+        self.nodes = {}
+        self._children = {}
+        # Prefetch statistics, used to estimate server latency for planning.
+        self.round_trips = 0
+        self.prefetch_seconds = 0.0
+        self.project_custom_attributes = {}
+
+    def add(self, node):
+        self.nodes[node.id] = node
+        self._children.setdefault(node.parent_id, []).append(node)
+
+    def children_of(self, parent_id):
+        """Returns the children of parent_id in their source sort order."""
+        # Handle cases where 'sort' is explicitly None to prevent crashes.
+        return sorted(self._children.get(parent_id, []), key=lambda node: node.sort or 0)
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+def _escape(value):
+    return value.replace('"', '\\"')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def prefetch_hierarchy(session, project_id, page_size=PREFETCH_PAGE_SIZE):
+    """Loads the full TypedContext tree of a project into a SourceIndex.
+
+    Uses one paged projection query for the hierarchy, one for task types,
+    one for shot frames (when the schema has them) and chunked queries for
+    custom attribute values. No source entity is touched lazily afterwards.
+    """
+    index = SourceIndex(project_id)
+    started = time.monotonic()
+
+    def paged(expression):
+        rows = 0
+        for entity in session.query(expression, page_size=page_size):
+            rows += 1
+            yield entity
+        index.round_trips += max(1, math.ceil(rows / page_size))
+
+    for entity in paged(
+        'select id, name, parent_id, object_type_id, sort, description '
+        f'from TypedContext where project_id is "{project_id}"'
+    ):
+        index.add(SourceNode(entity))
+
+    for task in paged(f'select id, type_id from Task where project_id is "{project_id}"'):
+        if task['id'] in index.nodes:
+            index.nodes[task['id']].type_id = task['type_id']
+
+    shot_attributes = session.types['Shot'].attributes
+    if shot_attributes.get('fstart') and shot_attributes.get('fend'):
+        for shot in paged(f'select id, fstart, fend from Shot where project_id is "{project_id}"'):
+            if shot['id'] in index.nodes:
+                index.nodes[shot['id']].frames = (shot['fstart'], shot['fend'])
+
+    node_ids = [project_id] + list(index.nodes)
+    for chunk in _chunks(node_ids, page_size):
+        ids = ', '.join(f'"{node_id}"' for node_id in chunk)
+        for value in paged(
+            'select entity_id, value, configuration.key from ContextCustomAttributeValue '
+            f'where entity_id in ({ids})'
+        ):
+            if value['entity_id'] == project_id:
+                values = index.project_custom_attributes
+            else:
+                values = index.nodes[value['entity_id']].custom_attributes
+            values[value['configuration']['key']] = value['value']
+
+    index.prefetch_seconds = time.monotonic() - started
+    logger.info(
+        f"Prefetched {len(index)} entities from project {project_id} "
+        f"in {index.round_trips} round trips ({index.prefetch_seconds:.1f}s)."
+    )
+    return index
+
+
+class CloneCounters:
+    """Thread-safe progress counters shared by every engine of one copy."""
+
+    def __init__(self, total=0):
+        self._lock = threading.Lock()
+        self.total = total
+        self.created = 0
+        self.fallbacks = 0
+        self.skipped = 0
+        self.resumed = 0
+
+    def add(self, created=0, fallbacks=0, skipped=0, resumed=0):
+        with self._lock:
+            self.created += created
+            self.fallbacks += fallbacks
+            self.skipped += skipped
+            self.resumed += resumed
+
+    @property
+    def done(self):
+        return self.created + self.skipped + self.resumed
+
+
+class CloneEngine:
+    """Breadth-first, batched clone of a project hierarchy."""
+
+    def __init__(self, session, batch_size=DEFAULT_BATCH_SIZE, counters=None, journal=None,
+                 progress=None, cancel_event=None, attributes=None, schema=None):
+        self.session = session
+        # SchemaLookup of the target project; without one, fallbacks are left to the server.
+        self.schema = schema
+        # AttributeConfigurations shared by every engine of a copy; loaded on first clone().
+        self.attributes = attributes
+        self.batch_size = max(1, int(batch_size))
+        self.counters = counters or CloneCounters()
+        self.journal = journal
+        self.cancel_event = cancel_event
+        # JobProgress of a Job living in this engine's session; flushed with the batch commits.
+        self.progress = progress
+        self.target_project_id = None
+        # Source -> target ID of every copied (or resumed) node, shared with the workers.
+        self.id_map = {}
+        self.logger = logging.getLogger(
+            __name__ + '.' + self.__class__.__name__
+        )
+
+    def clone(self, index, target_project, session_factory=None, workers=1):
+        """Clones every node of a prefetched SourceIndex underneath target_project.
+
+        With workers > 1 and a session_factory, only the first level is created
+        on this engine's session; each top-level subtree is then copied by a
+        worker thread on its own session.
+        """
+        self.counters.total = self.counters.total or len(index)
+        if self.attributes is None:
+            self.attributes = AttributeConfigurations(self.session)
+        self.target_project_id = target_project['id']
+        self.id_map[index.project_id] = self.target_project_id
+        root_level = [(index.project_id, self.target_project_id)]
+        workers = min(max(1, int(workers)), MAX_WORKERS)
+
+        if workers == 1 or session_factory is None:
+            self._clone_levels(index, root_level)
+        else:
+            top_level = self._clone_levels(index, root_level, max_depth=1)
+            self._clone_parallel(index, top_level, session_factory, workers)
+
+        self.logger.info(
+            f"Clone finished: {self.counters.created} created, "
+            f"{self.counters.fallbacks} fell back to Folder, {self.counters.skipped} skipped, "
+            f"{self.counters.resumed} already copied."
+        )
+
+    def _clone_levels(self, index, level, max_depth=None):
+        """Copies level by level starting from (source_parent_id, target_parent_id) pairs.
+
+        Stops after max_depth levels and returns the pairs of the next level.
+        """
+        depth = 0
+        while level and (max_depth is None or depth < max_depth):
+            depth += 1
+            pending = []
+            next_level = []
+            for source_parent_id, target_parent_id in level:
+                for child in index.children_of(source_parent_id):
+                    copied_id = self.journal.target_for(child.id) if self.journal else None
+                    if copied_id:
+                        self.counters.add(resumed=1)
+                        self.id_map[child.id] = copied_id
+                        if child.entity_type not in LEAF_ENTITY_TYPES:
+                            next_level.append((child.id, copied_id))
+                    else:
+                        pending.append((child, target_parent_id))
+
+            self.logger.info(f"Level {depth}: {len(pending)} entities to copy.")
+
+            for start in range(0, len(pending), self.batch_size):
+                if self.cancel_event and self.cancel_event.is_set():
+                    raise CopyCancelled("Copy cancelled by user.")
+                batch = pending[start:start + self.batch_size]
+                created = self._create_batch(batch)
+                if self.journal:
+                    self.journal.record([(source.id, target_id) for source, target_id in created])
+                for source_child, new_child_id in created:
+                    self.id_map[source_child.id] = new_child_id
+                    if source_child.entity_type not in LEAF_ENTITY_TYPES:
+                        next_level.append((source_child.id, new_child_id))
+            level = next_level
+        return level
+
+    def _clone_parallel(self, index, top_level, session_factory, workers):
+        """Copies each top-level subtree on a pool of per-thread sessions.
+
+        The first worker failure stops every other worker after its current
+        batch, as does a cancellation of the copy.
+        """
+        local = threading.local()
+        sessions = []
+        sessions_lock = threading.Lock()
+        stop = threading.Event()
+
+        def clone_subtree(source_id, target_id):
+            if not hasattr(local, 'session'):
+                local.session = session_factory()
+                with sessions_lock:
+                    sessions.append(local.session)
+            engine = CloneEngine(
+                local.session, self.batch_size, self.counters, self.journal,
+                cancel_event=stop, attributes=self.attributes, schema=self.schema
+            )
+            engine.target_project_id = self.target_project_id
+            engine.id_map = self.id_map
+            engine._clone_levels(index, [(source_id, target_id)])
+
+        self.logger.info(
+            f"Copying {len(top_level)} top-level subtrees with {workers} worker sessions."
+        )
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='clone-worker')
+        try:
+            pending = {
+                pool.submit(clone_subtree, source_id, target_id)
+                for source_id, target_id in top_level
+            }
+            while pending:
+                finished, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                if self.cancel_event and self.cancel_event.is_set():
+                    stop.set()
+                for future in finished:
+                    # Re-raise the first worker failure; the other workers are stopped below.
+                    future.result()
+                # The workers commit on their own sessions, so progress on
+                # this session needs its own (throttled) commit.
+                if self.progress and self.progress.update(self.counters):
+                    self.session.commit()
+        finally:
+            # Running workers stop after their current batch; queued subtrees never start.
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+            for session in sessions:
+                session.close()
+
+    def _child_data(self, source_child, target_parent_id):
+        """Builds the creation payload for a copy of source_child."""
+        # Parents are referenced by ID so resumed and parallel copies never
+        # need to load the target entities they attach to.
+        new_child_data = {
+            'name': source_child.name,
+            'parent_id': target_parent_id,
+            'project_id': self.target_project_id,
+            'description': source_child.description
+        }
+
+        # Attempt to keep the exact same Object Type (e.g., Scene, Sequence)
+        if source_child.object_type_id:
+            new_child_data['object_type_id'] = source_child.object_type_id
+
+        # Handle Shot Frames
+        if source_child.frames is not None:
+            new_child_data['fstart'], new_child_data['fend'] = source_child.frames
+
+        # Handle Task Type
+        if source_child.type_id:
+            new_child_data['type_id'] = source_child.type_id
+
+        return new_child_data
+
+    def _as_folder(self, new_child_data):
+        """Strips the type specific fields from a payload for a generic Folder."""
+        new_child_data.pop('object_type_id', None)
+        new_child_data.pop('fstart', None)  # Folders don't have frames
+        new_child_data.pop('fend', None)
+        new_child_data.pop('type_id', None)
+        return new_child_data
+
+    def _prepare(self, source_child, target_parent_id):
+        """Returns (entity_type, payload, object_type_id, is_fallback) for a copy of source_child."""
+        new_child_data = self._child_data(source_child, target_parent_id)
+        if self.schema and self.schema.resolve_entity_type(source_child) != source_child.entity_type:
+            self.logger.info(
+                f"Schema Restriction: '{source_child.name}' ({source_child.entity_type}) is not allowed "
+                f"by the schema. Creating it as a generic 'Folder'."
+            )
+            return 'Folder', self._as_folder(new_child_data), self.attributes.folder_object_type_id, True
+        return source_child.entity_type, new_child_data, source_child.object_type_id, False
+
+    def _copy_custom_attributes(self, source_child, new_child, object_type_id):
+        # Only attributes configured for the target object type are written (Schema check)
+        self.attributes.push_values(
+            self.session, new_child['id'], source_child.custom_attributes, object_type_id
+        )
+
+    def _create_batch(self, batch):
+        """Creates a batch of entities in one commit.
+
+        Returns a list of (source, created ID) pairs. If the server rejects the
+        batch for a recoverable reason the batch is replayed entity by entity.
+        """
+        created = []
+        fallbacks = 0
+        for source_child, target_parent_id in batch:
+            entity_type, new_child_data, object_type_id, is_fallback = self._prepare(
+                source_child, target_parent_id
+            )
+            new_child = self.session.create(entity_type, new_child_data)
+            self._copy_custom_attributes(source_child, new_child, object_type_id)
+            created.append((source_child, new_child['id']))
+            fallbacks += is_fallback
+
+        if self.progress:
+            self.progress.update(self.counters)
+        try:
+            self.session.commit()
+        except ftrack_api.exception.ServerError as e:
+            self.session.rollback()
+            if not any(name in str(e) for name in RECOVERABLE_ERRORS):
+                raise
+            self.logger.warning(
+                f"Batch of {len(batch)} entities rejected by the server, "
+                f"retrying one entity at a time. Reason: {e}"
+            )
+            return self._create_individually(batch)
+
+        self.counters.add(created=len(created), fallbacks=fallbacks)
+        return created
+
+    def _create_individually(self, batch):
+        """Per-entity fallback used for a batch that failed to commit."""
+        created = []
+        for source_child, target_parent_id in batch:
+            new_child_id = self._create_one(source_child, target_parent_id)
+            if new_child_id:
+                created.append((source_child, new_child_id))
+        return created
+
+    def _create_one(self, source_child, target_parent_id):
+        """Creates a single entity, returning the new (or existing) target ID."""
+        entity_type, new_child_data, object_type_id, is_fallback = self._prepare(
+            source_child, target_parent_id
+        )
+        try:
+            # Try to create the same type as the source (or the schema fallback)
+            new_child = self.session.create(entity_type, new_child_data)
+            self._copy_custom_attributes(source_child, new_child, object_type_id)
+            self.session.commit()
+            self.counters.add(created=1, fallbacks=int(is_fallback))
+            return new_child['id']
+
+        except ftrack_api.exception.ServerError as e:
+            error_str = str(e)
+            self.session.rollback()
+
+            # Handle DuplicateEntryError - adopt the existing entity so its
+            # children are still copied (e.g. a batch committed just before a crash).
+            if "DuplicateEntryError" in error_str:
+                self.logger.warning(
+                    f"Skipping '{source_child.name}' - already exists in target project."
+                )
+                self.counters.add(skipped=1)
+                existing = self.session.query(
+                    f'select id from TypedContext where parent_id is "{target_parent_id}" '
+                    f'and name is "{_escape(source_child.name)}"'
+                ).first()
+                return existing['id'] if existing else None
+
+            # Catch Schema Validation Errors the lookup did not anticipate
+            # (e.g. "Object type 'Scene' cannot be created...")
+            if "ValidationError" not in error_str:
+                # If it's a real server error (e.g. Database down), raise it.
+                raise
+            if is_fallback:
+                self.logger.error(f" -> Failed even as Folder: {e}")
+                self.counters.add(skipped=1)
+                return None
+
+            self.logger.warning(
+                f"Schema Restriction: Could not create '{source_child.name}' as '{source_child.entity_type}'. "
+                f"Falling back to generic 'Folder' to preserve structure."
+            )
+
+        except Exception as e:
+            self.logger.error(f"Unexpected error copying '{source_child.name}': {e}")
+            self.session.rollback()
+            self.counters.add(skipped=1)
+            return None
+
+        # FALLBACK: Remove specific type ID and retry as a generic Folder
+        try:
+            new_child = self.session.create('Folder', self._as_folder(new_child_data))
+            self._copy_custom_attributes(source_child, new_child, self.attributes.folder_object_type_id)
+            self.session.commit()
+            self.logger.info(f" -> Success: Created '{source_child.name}' as a Folder.")
+            self.counters.add(created=1, fallbacks=1)
+            return new_child['id']
+        except Exception as e2:
+            self.logger.error(f" -> Failed even as Folder: {e2}")
+            self.session.rollback()
+            self.counters.add(skipped=1)
+            return None
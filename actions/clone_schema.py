@@ -0,0 +1,51 @@
+"""
+Clone Schema Module
+Precomputes, once per copy, what a project schema allows (object types and
+task types), so the project copy decides client-side which source entities
+have to fall back to a Folder instead of discovering it through a failed
+commit.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Entity types that are governed by task types rather than the schema object types.
+TASK_LIKE_ENTITY_TYPES = ('Task', 'Milestone')
+
+
+class SchemaLookup:
+    """Allowed object types and task types of one ProjectSchema."""
+
+    def __init__(self, session, project_schema_id):
+        schema = session.get('ProjectSchema', project_schema_id)
+        self.name = schema['name']
+        self.allowed_object_type_ids = {
+            object_type['id'] for object_type in schema['object_types']
+        }
+        self.allowed_task_type_ids = {
+            task_type['id'] for task_type in schema.get_types('Task')
+        }
+        self.object_type_names = {
+            object_type['id']: object_type['name']
+            for object_type in session.query('select id, name from ObjectType')
+        }
+        logger.info(
+            f"Schema '{self.name}' allows {len(self.allowed_object_type_ids)} object types "
+            f"and {len(self.allowed_task_type_ids)} task types."
+        )
+
+    def resolve_entity_type(self, node):
+        """Returns the entity type a copy of node will be created as."""
+        if node.entity_type == 'Task':
+            # An empty list means the schema does not restrict anything.
+            if self.allowed_task_type_ids and node.type_id not in self.allowed_task_type_ids:
+                return 'Folder'
+            return node.entity_type
+        if node.entity_type in TASK_LIKE_ENTITY_TYPES:
+            return node.entity_type
+        if not self.allowed_object_type_ids or not node.object_type_id:
+            return node.entity_type
+        if node.object_type_id in self.allowed_object_type_ids:
+            return node.entity_type
+        return 'Folder'
@@ -0,0 +1,255 @@
+"""
+Copy Assets Module
+Optional stage of the project copy that runs after the hierarchy is cloned.
+Streams the source project's Asset and AssetVersion metadata (no components),
+AssetVersion/TypedContext lists with their items, and review session folders,
+sessions and their versions into the target project.
+Source rows are read in pages and written in batched commits on a session of
+the stage's own; its cache is cleared after every commit so memory only grows
+with the source -> target ID map needed to re-link versions. A batch the
+server rejects for a recoverable reason is retried one entity at a time,
+skipping the rows that still fail. Progress is committed through the
+session of the Job.
+"""
+
+import collections
+import logging
+
+import ftrack_api
+
+from actions.clone_engine import (
+    DEFAULT_BATCH_SIZE, PREFETCH_PAGE_SIZE, RECOVERABLE_ERRORS, CopyCancelled
+)
+
+logger = logging.getLogger(__name__)
+
+# List entity types copied together with the ListObject rows that fill them.
+LIST_ENTITY_TYPES = ('AssetVersionList', 'TypedContextList')
+
+STAGE_NAME = 'Copying assets, versions, lists and review sessions'
+
+
+class AssetStage:
+    """Streams asset level data from a source project into its copy.
+
+    session must be used by this stage only, as its cache is cleared after
+    every batch.
+    """
+
+    def __init__(self, session, source_project_id, target_project_id, id_map, journal=None,
+                 progress=None, cancel_event=None, batch_size=DEFAULT_BATCH_SIZE,
+                 page_size=PREFETCH_PAGE_SIZE):
+        self.session = session
+        self.source_project_id = source_project_id
+        self.target_project_id = target_project_id
+        # Source -> target IDs; seeded with the cloned hierarchy and extended by this stage.
+        self.id_map = id_map
+        self.journal = journal
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.batch_size = max(1, int(batch_size))
+        self.page_size = page_size
+        self.counts = collections.OrderedDict(
+            (name, 0) for name in (
+                'assets', 'versions', 'lists', 'list_items',
+                'review_folders', 'review_sessions', 'review_items', 'skipped',
+            )
+        )
+        self._pending = []
+        self.logger = logging.getLogger(
+            __name__ + '.' + self.__class__.__name__
+        )
+
+    def run(self):
+        """Copies everything; each entity type is committed before the next one needs it."""
+        for step in (
+            self._copy_assets,
+            self._copy_versions,
+            self._copy_lists,
+            self._copy_list_items,
+            self._copy_review_folders,
+            self._copy_review_sessions,
+            self._copy_review_items,
+        ):
+            step()
+            self._flush()
+        self._report(force=True)
+        self.logger.info(f"Asset stage finished: {dict(self.counts)}")
+        return self.counts
+
+    def _stream(self, expression):
+        return self.session.query(expression, page_size=self.page_size)
+
+    def _create(self, source_id, entity_type, data, count_name):
+        """Queues the creation of one entity, committing whenever a batch is full."""
+        if self.cancel_event and self.cancel_event.is_set():
+            raise CopyCancelled("Copy cancelled by user.")
+
+        copied_id = self.journal.target_for(source_id) if self.journal else None
+        if copied_id:
+            self.id_map[source_id] = copied_id
+            return
+
+        entity = self.session.create(entity_type, data)
+        self._pending.append((source_id, entity['id'], entity_type, data, count_name))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _skip(self):
+        self.counts['skipped'] += 1
+
+    def _report(self, force=False):
+        if self.progress and self.progress.update_counts(STAGE_NAME, self.counts, force=force):
+            # The Job belongs to the copy's session, not to this stage's.
+            self.progress.job.session.commit()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            self.session.commit()
+            created = [
+                (source_id, target_id, count_name)
+                for source_id, target_id, _entity_type, _data, count_name in batch
+            ]
+        except ftrack_api.exception.ServerError as e:
+            self.session.rollback()
+            if not any(name in str(e) for name in RECOVERABLE_ERRORS):
+                raise
+            self.logger.warning(
+                f"Batch of {len(batch)} entities rejected by the server, "
+                f"retrying one entity at a time. Reason: {e}"
+            )
+            created = self._create_individually(batch)
+
+        pairs = [(source_id, target_id) for source_id, target_id, _count_name in created]
+        if self.journal:
+            self.journal.record(pairs)
+        self.id_map.update(pairs)
+        for _source_id, _target_id, count_name in created:
+            self.counts[count_name] += 1
+        self._report()
+
+        # Committed entities are only needed by ID from here on.
+        self.session.cache.clear()
+
+    def _create_individually(self, batch):
+        """Per-entity fallback used for a batch that failed to commit."""
+        created = []
+        for source_id, _target_id, entity_type, data, count_name in batch:
+            try:
+                entity = self.session.create(entity_type, data)
+                self.session.commit()
+            except ftrack_api.exception.ServerError as e:
+                self.session.rollback()
+                if not any(name in str(e) for name in RECOVERABLE_ERRORS):
+                    raise
+                self.logger.warning(f"Skipping {entity_type} copied from {source_id}: {e}")
+                self._skip()
+                continue
+            created.append((source_id, entity['id'], count_name))
+        return created
+
+    def _copy_assets(self):
+        for asset in self._stream(
+            'select id, name, context_id, type_id from Asset '
+            f'where project.id is "{self.source_project_id}"'
+        ):
+            context_id = self.id_map.get(asset['context_id'])
+            if not context_id:
+                self._skip()
+                continue
+            self._create(asset['id'], 'Asset', {
+                'name': asset['name'],
+                'context_id': context_id,
+                'type_id': asset['type_id'],
+            }, 'assets')
+
+    def _copy_versions(self):
+        for version in self._stream(
+            'select id, asset_id, version, comment, task_id from AssetVersion '
+            f'where project_id is "{self.source_project_id}"'
+        ):
+            asset_id = self.id_map.get(version['asset_id'])
+            if not asset_id:
+                self._skip()
+                continue
+            data = {
+                'asset_id': asset_id,
+                'version': version['version'],
+                'comment': version['comment'],
+            }
+            task_id = self.id_map.get(version['task_id'])
+            if task_id:
+                data['task_id'] = task_id
+            self._create(version['id'], 'AssetVersion', data, 'versions')
+
+    def _copy_lists(self):
+        for list_type in LIST_ENTITY_TYPES:
+            for source_list in self._stream(
+                f'select id, name, category_id from {list_type} '
+                f'where project_id is "{self.source_project_id}"'
+            ):
+                self._create(source_list['id'], list_type, {
+                    'name': source_list['name'],
+                    'category_id': source_list['category_id'],
+                    'project_id': self.target_project_id,
+                }, 'lists')
+
+    def _copy_list_items(self):
+        for item in self._stream(
+            'select id, list_id, entity_id from ListObject '
+            f'where list.project_id is "{self.source_project_id}"'
+        ):
+            list_id = self.id_map.get(item['list_id'])
+            entity_id = self.id_map.get(item['entity_id'])
+            if not (list_id and entity_id):
+                self._skip()
+                continue
+            self._create(item['id'], 'ListObject', {
+                'list_id': list_id,
+                'entity_id': entity_id,
+            }, 'list_items')
+
+    def _copy_review_folders(self):
+        for folder in self._stream(
+            f'select id, name from ReviewSessionFolder where project_id is "{self.source_project_id}"'
+        ):
+            self._create(folder['id'], 'ReviewSessionFolder', {
+                'name': folder['name'],
+                'project_id': self.target_project_id,
+            }, 'review_folders')
+
+    def _copy_review_sessions(self):
+        for review_session in self._stream(
+            'select id, name, description, review_session_folder_id from ReviewSession '
+            f'where project_id is "{self.source_project_id}"'
+        ):
+            data = {
+                'name': review_session['name'],
+                'description': review_session['description'],
+                'project_id': self.target_project_id,
+            }
+            folder_id = self.id_map.get(review_session['review_session_folder_id'])
+            if folder_id:
+                data['review_session_folder_id'] = folder_id
+            self._create(review_session['id'], 'ReviewSession', data, 'review_sessions')
+
+    def _copy_review_items(self):
+        for item in self._stream(
+            'select id, name, description, version, review_session_id, version_id from ReviewSessionObject '
+            f'where review_session.project_id is "{self.source_project_id}"'
+        ):
+            review_session_id = self.id_map.get(item['review_session_id'])
+            version_id = self.id_map.get(item['version_id'])
+            if not (review_session_id and version_id):
+                self._skip()
+                continue
+            self._create(item['id'], 'ReviewSessionObject', {
+                'name': item['name'],
+                'description': item['description'],
+                'version': item['version'],
+                'review_session_id': review_session_id,
+                'version_id': version_id,
+            }, 'review_items')
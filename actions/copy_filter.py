@@ -0,0 +1,140 @@
+"""
+Copy Filter Module
+Selective project copy. Prunes a prefetched SourceIndex to a chosen subtree,
+a maximum depth, included/excluded entity types and a name glob before the
+copy starts, so excluded branches never cost a server call.
+"""
+
+import fnmatch
+
+from actions.clone_engine import SourceIndex, SourceNode
+
+
+def _split_list(value):
+    return {part.strip().lower() for part in (value or '').split(',') if part.strip()}
+
+
+def _parse_depth(value):
+    """The max depth entered in the form; empty means no limit."""
+    if value in (None, ''):
+        return 0
+    try:
+        depth = int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"Max Depth must be a whole number, not '{value}'.") from None
+    if depth < 0:
+        raise ValueError(f"Max Depth cannot be negative ({depth}).")
+    return depth
+
+
+def _reparented(node, parent_id):
+    """Copy of a SourceNode attached to another parent."""
+    copy = SourceNode.__new__(SourceNode)
+    for slot in SourceNode.__slots__:
+        setattr(copy, slot, getattr(node, slot))
+    copy.parent_id = parent_id
+    return copy
+
+
+class CopyFilter:
+    """Selection rules evaluated on the prefetched source tree.
+
+    subtree_path  -- names from the project down to the node to copy, e.g. "sq010/sh020".
+                     Its ancestors are copied too (without their other children).
+    max_depth     -- deepest level to copy, 1 being the project's direct children; 0 = no limit.
+    include_types -- if set, only these entity types are copied. Kept entities whose
+                     parents are not copied move up under their nearest copied
+                     ancestor (e.g. "shot" copies every Shot straight under the project).
+    exclude_types -- entity types that are not copied (with everything below them).
+    name_glob     -- only copy branches containing a match; everything under a match is copied.
+    """
+
+    def __init__(self, subtree_path='', max_depth=0, include_types=(), exclude_types=(), name_glob=''):
+        self.subtree_path = [part for part in (subtree_path or '').strip('/').split('/') if part]
+        self.max_depth = _parse_depth(max_depth)
+        self.include_types = {entity_type.lower() for entity_type in include_types}
+        self.exclude_types = {entity_type.lower() for entity_type in exclude_types}
+        self.name_glob = (name_glob or '').strip()
+
+    @classmethod
+    def from_form(cls, values):
+        """Filter of the copy form; raises ValueError for invalid values."""
+        return cls(
+            subtree_path=values.get('subtree_path'),
+            max_depth=values.get('max_depth'),
+            include_types=_split_list(values.get('include_types')),
+            exclude_types=_split_list(values.get('exclude_types')),
+            name_glob=values.get('name_glob'),
+        )
+
+    @property
+    def active(self):
+        return bool(
+            self.subtree_path or self.max_depth or self.include_types
+            or self.exclude_types or self.name_glob
+        )
+
+    def apply(self, index):
+        """Returns a new SourceIndex holding only the selected nodes."""
+        if not self.active:
+            return index
+
+        filtered = SourceIndex(index.project_id)
+        filtered.round_trips = index.round_trips
+        filtered.prefetch_seconds = index.prefetch_seconds
+        filtered.project_custom_attributes = index.project_custom_attributes
+
+        # Resolve the subtree path; its ancestors are kept to preserve the structure.
+        roots = index.children_of(index.project_id)
+        depth = 1
+        for position, name in enumerate(self.subtree_path):
+            match = next((node for node in roots if node.name == name), None)
+            if match is None:
+                raise ValueError(f"Subtree '{'/'.join(self.subtree_path[:position + 1])}' not found in source project.")
+            if position < len(self.subtree_path) - 1:
+                filtered.add(match)
+                roots = index.children_of(match.id)
+                depth += 1
+            else:
+                roots = [match]
+
+        for node in roots:
+            self._visit(index, filtered, node, depth, not self.name_glob, node.parent_id)
+        return filtered
+
+    def _visit(self, index, filtered, node, depth, matched, parent_id):
+        """Adds node and its selected descendants under parent_id. Returns True if anything was added."""
+        if self.max_depth and depth > self.max_depth:
+            return False
+        entity_type = node.entity_type.lower()
+        if entity_type in self.exclude_types:
+            return False
+        included = not self.include_types or entity_type in self.include_types
+
+        matched = matched or fnmatch.fnmatch(node.name.lower(), self.name_glob.lower())
+        # Children of a node that is not copied attach to its nearest copied ancestor.
+        child_parent_id = node.id if included else parent_id
+        kept_children = [
+            child for child in index.children_of(node.id)
+            if self._visit(index, filtered, child, depth + 1, matched, child_parent_id)
+        ]
+        if not included:
+            return bool(kept_children)
+        if not (matched or kept_children):
+            return False
+        filtered.add(node if node.parent_id == parent_id else _reparented(node, parent_id))
+        return True
+
+    def describe(self):
+        parts = []
+        if self.subtree_path:
+            parts.append(f"subtree {'/'.join(self.subtree_path)}")
+        if self.max_depth:
+            parts.append(f"max depth {self.max_depth}")
+        if self.include_types:
+            parts.append(f"only {', '.join(sorted(self.include_types))}")
+        if self.exclude_types:
+            parts.append(f"without {', '.join(sorted(self.exclude_types))}")
+        if self.name_glob:
+            parts.append(f"names matching {self.name_glob}")
+        return '; '.join(parts) or 'everything'
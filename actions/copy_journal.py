@@ -0,0 +1,113 @@
+"""
+Copy Journal Module
+Append-only JSONL checkpoint of a project copy.
+Maps every source entity ID to the ID created in the target project, so a
+copy interrupted by a crash or container restart can be resumed by running
+it again with the same source project and new project name.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Directory holding service state that must survive a process restart.
+STATE_DIR = os.getenv('FTRACK_STATE_DIR', os.path.join(tempfile.gettempdir(), 'ftrack_state'))
+JOURNAL_DIR = os.path.join(STATE_DIR, 'copy_journals')
+
+
+class CopyJournal:
+    """Checkpoint journal for one (source project, new project name) copy."""
+
+    def __init__(self, source_project_id, new_project_name, journal_dir=JOURNAL_DIR):
+        key = hashlib.sha1(f'{source_project_id}:{new_project_name}'.encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(journal_dir, f'{key}.jsonl')
+        self.source_project_id = source_project_id
+        self.new_project_name = new_project_name
+        self.target_project_id = None
+        self.job_ids = []
+        self.mapping = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def pending(cls, journal_dir=JOURNAL_DIR):
+        """Yields the journals of every copy that never completed."""
+        for path in sorted(glob.glob(os.path.join(journal_dir, '*.jsonl'))):
+            with open(path, encoding='utf-8') as f:
+                first_line = f.readline()
+            try:
+                header = json.loads(first_line)
+            except ValueError:
+                logger.warning(f"Ignoring unreadable copy journal: {path}")
+                continue
+            yield cls(header['source_project_id'], header['new_project_name'], journal_dir)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write; everything before it is valid.
+                    continue
+                if 'source' in record:
+                    self.mapping[record['source']] = record['target']
+                elif 'target_project_id' in record:
+                    self.target_project_id = record['target_project_id']
+                if 'job_id' in record:
+                    self.job_ids.append(record['job_id'])
+        logger.info(f"Loaded copy journal {self.path} with {len(self.mapping)} entries.")
+
+    @property
+    def resumable(self):
+        return self.target_project_id is not None
+
+    def start(self, target_project_id, job_id):
+        """Records the target project of a new copy."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.target_project_id = target_project_id
+        self.job_ids = [job_id]
+        self.mapping = {}
+        self._write([{
+            'source_project_id': self.source_project_id,
+            'new_project_name': self.new_project_name,
+            'target_project_id': target_project_id,
+            'job_id': job_id,
+        }], mode='w')
+
+    def resume(self, job_id):
+        """Records the job that continues an interrupted copy."""
+        self.job_ids.append(job_id)
+        self._write([{'job_id': job_id}])
+
+    def target_for(self, source_id):
+        return self.mapping.get(source_id)
+
+    def record(self, pairs):
+        """Appends committed (source_id, target_id) pairs to the journal."""
+        with self._lock:
+            for source_id, target_id in pairs:
+                self.mapping[source_id] = target_id
+            self._write([{'source': s, 'target': t} for s, t in pairs])
+
+    def complete(self):
+        """Removes the journal once the copy finished successfully."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _write(self, records, mode='a'):
+        with open(self.path, mode, encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
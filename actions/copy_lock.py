@@ -1,35 +1,378 @@
 """
 Copy Lock Module
-Provides a file-based lock to indicate when a project copy is in progress.
-Uses a file-based approach so it works across multiple processes.
-Other actions can check this flag and skip processing during copy operations.
+Provides per-project, lease based locks to indicate when a project copy is in progress.
+Each lock is a small JSON file in LOCK_DIR named after the project ID, so it works
+across multiple processes. The copy refreshes its lease with a heartbeat; a lease
+that has not been refreshed within its TTL is stale and is reclaimed automatically,
+so a crashed copy can no longer pause the other actions forever.
+Other actions check the project of each event entity and only skip the entities
+that belong to a project being copied. The lease names the API user the copy
+runs as, so the entities the copy creates itself can be told apart from the
+ones artists add meanwhile. A released lease is kept for a short drain
+period, as the update events of the copy's last commits arrive after it
+finished. They read the locks from a per-process
+cache kept current by a watcher thread, so the check per event is a memory read.
 """
 
+import contextlib
+import json
+import logging
 import os
+import socket
 import tempfile
+import threading
+import time
+import uuid
 
-# Use a lock file in a temp directory that persists across process restarts
-LOCK_FILE = os.path.join(tempfile.gettempdir(), "ftrack_copy_in_progress.lock")
+logger = logging.getLogger(__name__)
 
+# Use a lock directory in a temp directory that persists across process restarts
+LOCK_DIR = os.path.join(tempfile.gettempdir(), "ftrack_copy_locks")
 
-def is_copy_in_progress():
-    """Returns True if a project copy is currently in progress."""
-    return os.path.exists(LOCK_FILE)
+# Seconds a lease stays valid without a heartbeat.
+LEASE_TTL = float(os.getenv('FTRACK_COPY_LOCK_TTL', '120'))
 
+# Seconds a released lease is kept so the events of the copy's last commits are still told apart.
+LEASE_DRAIN_SECONDS = float(os.getenv('FTRACK_COPY_LOCK_DRAIN_SECONDS', '30'))
 
-def set_copy_in_progress(value: bool):
-    """Sets the copy-in-progress flag by creating/removing a lock file."""
-    if value:
-        # Create the lock file
+# Seconds after which the guard file of a process that died while holding it is removed.
+GUARD_STALE_SECONDS = 10
+
+# Seconds between two checks of LOCK_DIR by the lock watcher of each process.
+WATCH_INTERVAL = float(os.getenv('FTRACK_COPY_LOCK_POLL_SECONDS', '0.5'))
+
+
+def _lock_path(project_id):
+    return os.path.join(LOCK_DIR, f"{project_id}.lock")
+
+
+def _read_lease(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            lease = json.load(f)
+    except OSError:
+        return None
+    except ValueError:
+        # A broken file, or one acquire() created and is writing under the guard.
+        return {}
+    return lease if isinstance(lease, dict) else {}
+
+
+def _is_live(lease, now=None):
+    """A lease without a valid heartbeat and ttl (truncated, older format) counts as stale."""
+    if not lease:
+        return False
+    heartbeat, ttl = lease.get('heartbeat'), lease.get('ttl')
+    if not isinstance(heartbeat, (int, float)) or not isinstance(ttl, (int, float)):
+        return False
+    return heartbeat + ttl > (now or time.time())
+
+
+def _age(path):
+    try:
+        return time.time() - os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Could not remove {path}: {e}")
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def _guarded(path, wait=True):
+    """Serialises every change of the lease at path across threads and processes.
+
+    The guard is a file created exclusively next to the lease and held for a
+    few file operations only. Yields False without holding the guard when
+    wait is False and it is taken.
+    """
+    guard_path = f"{path}.guard"
+    while True:
         try:
-            with open(LOCK_FILE, 'w') as f:
-                f.write("copy in progress")
-        except Exception:
-            pass
+            os.close(os.open(guard_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            if _age(guard_path) > GUARD_STALE_SECONDS:
+                # Left by a process that died while holding it.
+                _remove(guard_path)
+                continue
+            if not wait:
+                yield False
+                return
+            time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        _remove(guard_path)
+
+
+def _reclaim(path, lease, draining=False):
+    """Removes a stale lease left behind by a crashed copy (with draining, also a draining lease).
+
+    Call with the guard of path held. Returns False if the lease is live.
+    """
+    # Another process may have refreshed or reclaimed it since it was read.
+    current = _read_lease(path)
+    if current is None:
+        return True
+    if _is_live(current) and not (draining and current.get('draining')):
+        return False
+    lease = current or lease or {}
+    if lease.get('draining'):
+        logger.info(f"Copy lock of project {lease.get('project_id', '?')} drained - its events resumed.")
     else:
-        # Remove the lock file
+        logger.warning(
+            f"Reclaiming stale copy lock for project {lease.get('project_id', '?')} "
+            f"(owner {lease.get('owner', '?')})."
+        )
+    return _remove(path)
+
+
+def _event_username(event):
+    user = ((event or {}).get('source') or {}).get('user') or {}
+    return user.get('username')
+
+
+def event_project_id(entity):
+    """Returns the project ID of an ftrack.update event entity, if it carries one."""
+    if entity.get('entityType') == 'show':
+        return entity.get('entityId')
+    for parent in entity.get('parents') or []:
+        if parent.get('entityType') == 'show':
+            return parent.get('entityId')
+    return None
+
+
+class LockWatcher:
+    """Per-process cache of the leases in LOCK_DIR.
+
+    A background thread stats LOCK_DIR every interval and only re-reads the
+    lease files when the directory changed (every lease write is a rename),
+    so looking up a lock never touches the filesystem.
+    """
+
+    def __init__(self, interval=WATCH_INTERVAL):
+        self.interval = interval
+        # project_id -> lease; replaced as a whole, never mutated.
+        self.leases = {}
+        self._mtime = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def snapshot(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+        return self.leases
+
+    def _start(self):
+        with self._start_lock:
+            # Also restarts after a fork, which does not copy the thread.
+            if self._thread is None or not self._thread.is_alive():
+                self.refresh()
+                self._thread = threading.Thread(target=self._run, name='copy-lock-watcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Copy lock watcher failed to refresh: {e}")
+
+    def refresh(self):
         try:
-            if os.path.exists(LOCK_FILE):
-                os.remove(LOCK_FILE)
-        except Exception:
-            pass
+            mtime = os.stat(LOCK_DIR).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self.leases = self._load() if mtime is not None else {}
+
+        now = time.time()
+        for project_id, lease in self.leases.items():
+            if not _is_live(lease, now):
+                # Removing the file changes the directory, so the next refresh reloads.
+                path = _lock_path(project_id)
+                with _guarded(path, wait=False) as guarded:
+                    if guarded:
+                        _reclaim(path, lease)
+
+    def _load(self):
+        leases = {}
+        for entry in os.scandir(LOCK_DIR):
+            if entry.name.endswith('.lock'):
+                lease = _read_lease(entry.path)
+                if lease is not None:
+                    # Keyed by file name, so a malformed lease is still found and reclaimed.
+                    leases[entry.name[:-len('.lock')]] = lease
+        return leases
+
+
+_watcher = LockWatcher()
+
+
+def is_copy_in_progress(project_id=None):
+    """Returns True if a live copy lock exists for project_id (any project if None)."""
+    leases = _watcher.snapshot()
+    now = time.time()
+    if project_id:
+        return _is_live(leases.get(project_id), now)
+    return any(_is_live(lease, now) for lease in leases.values())
+
+
+def is_entity_locked(entity):
+    """Returns True if an event entity belongs to a project being copied.
+
+    Entities without project information are treated as locked while any copy runs.
+    """
+    project_id = event_project_id(entity)
+    return is_copy_in_progress(project_id)
+
+
+def is_copy_event(event, entity):
+    """Returns True if a locked entity was changed by the copy itself, i.e. by the
+    API user of the copy holding its project's lock (of any copy, without project).
+    """
+    username = _event_username(event)
+    if not username:
+        return False
+    leases = _watcher.snapshot()
+    now = time.time()
+    project_id = event_project_id(entity)
+    candidates = [leases.get(project_id)] if project_id else leases.values()
+    return any(
+        _is_live(lease, now) and lease.get('api_user') == username
+        for lease in candidates
+    )
+
+
+class CopyLease:
+    """Lease on the copy lock of one project, kept alive by a heartbeat thread.
+
+    acquire() before the copy and release() once it finished; the lease
+    can also be used as a context manager.
+    """
+
+    def __init__(self, project_id, ttl=LEASE_TTL, api_user=None):
+        self.project_id = project_id
+        self.ttl = ttl
+        # The user the copy's sessions run as; their events are the copy's own.
+        self.api_user = api_user or os.getenv('FTRACK_API_USER')
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.path = _lock_path(project_id)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        """Takes the lock; raises RuntimeError while another copy of the project holds it.
+
+        The lock file is created exclusively under the guard of the project,
+        so of two copies racing for a project only one gets it; a stale or
+        draining lease is reclaimed first.
+        """
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        with _guarded(self.path):
+            while True:
+                try:
+                    fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    lease = _read_lease(self.path)
+                    # A draining lease belongs to a copy that already finished.
+                    if _is_live(lease) and not lease.get('draining'):
+                        raise RuntimeError(
+                            f"Project {self.project_id} is already being copied by {lease.get('owner')}."
+                        )
+                    if not _reclaim(self.path, lease, draining=True):
+                        raise RuntimeError(f"Could not take the copy lock of project {self.project_id}.")
+                    continue
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._lease(), f)
+                break
+
+        # Confirms the lease on disk is this one.
+        lease = _read_lease(self.path)
+        if not lease or lease.get('owner') != self.owner:
+            raise RuntimeError(
+                f"Project {self.project_id} is already being copied by {(lease or {}).get('owner', '?')}."
+            )
+        self._thread = threading.Thread(
+            target=self._heartbeat, name=f"copy-lock-{self.project_id}", daemon=True
+        )
+        self._thread.start()
+        _watcher.refresh()
+        logger.info(f"Copy lock ENABLED for project {self.project_id} - its events will be paused.")
+        return self
+
+    def release(self, drain=LEASE_DRAIN_SECONDS):
+        """Stops the heartbeat and lets the lease expire after drain seconds.
+
+        Until then the update events of the copy's last commits, which arrive
+        after it finished, are still recognised as its own and artists'
+        changes are still buffered. The lock watchers remove the expired lease.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        with _guarded(self.path):
+            lease = _read_lease(self.path)
+            if lease and lease.get('owner') == self.owner:
+                try:
+                    if drain > 0:
+                        self._write(ttl=drain, draining=True)
+                    else:
+                        os.remove(self.path)
+                except OSError as e:
+                    logger.error(f"Could not release copy lock for project {self.project_id}: {e}")
+        _watcher.refresh()
+        if drain > 0:
+            logger.info(
+                f"Copy lock DRAINING for project {self.project_id} - its events resume in {drain:g}s."
+            )
+        else:
+            logger.info(f"Copy lock DISABLED for project {self.project_id} - its events resumed.")
+
+    def _lease(self, ttl=None, draining=False):
+        return {
+            'project_id': self.project_id,
+            'owner': self.owner,
+            'api_user': self.api_user,
+            'heartbeat': time.time(),
+            'ttl': ttl or self.ttl,
+            'draining': draining,
+        }
+
+    def _write(self, ttl=None, draining=False):
+        # Write to a temp file and rename, so readers never see a partial lease.
+        tmp_path = f"{self.path}.{self.owner.replace(':', '_')}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._lease(ttl, draining), f)
+        os.replace(tmp_path, self.path)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.ttl / 4):
+            try:
+                with _guarded(self.path):
+                    lease = _read_lease(self.path)
+                    if lease and lease.get('owner') != self.owner:
+                        # Reclaimed after a missed heartbeat and taken by another copy.
+                        logger.error(f"Copy lock of project {self.project_id} was taken by {lease.get('owner')}.")
+                        return
+                    self._write()
+            except OSError as e:
+                logger.error(f"Could not refresh copy lock for project {self.project_id}: {e}")
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
@@ -0,0 +1,128 @@
+"""
+Copy Planner Module
+Dry-run estimate for a project copy, computed from the prefetched source tree
+only: entity counts per type, schema fallbacks to Folder, the number of
+commits/round trips the copy will need and the expected wall time.
+"""
+
+import math
+import os
+from collections import Counter
+
+from actions.clone_engine import LEAF_ENTITY_TYPES, MAX_WORKERS
+
+# Rough server-side cost of creating one entity inside a batched commit.
+SECONDS_PER_ENTITY = float(os.getenv('FTRACK_COPY_SECONDS_PER_ENTITY', '0.02'))
+
+# Latency used when the prefetch was too quick to measure one.
+DEFAULT_ROUND_TRIP_SECONDS = 0.2
+
+# Commits issued around the hierarchy copy (job creation, project creation, final job update).
+FIXED_COMMITS = 3
+
+# Number of fallback entity names quoted in the summary.
+MAX_FALLBACK_EXAMPLES = 5
+
+
+class CopyPlan:
+    """Result of a dry run."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.fallbacks = Counter()
+        self.fallback_examples = []
+        self.levels = []
+        self.commits = 0
+        self.round_trips = 0
+        self.estimated_seconds = 0.0
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def summary(self):
+        counts = ', '.join(f"{entity_type}: {count}" for entity_type, count in self.counts.most_common())
+        lines = [f"{self.total} entities ({counts or 'none'}) in {len(self.levels)} levels."]
+        if self.fallbacks:
+            fallbacks = ', '.join(f"{name}: {count}" for name, count in self.fallbacks.most_common())
+            lines.append(
+                f"{sum(self.fallbacks.values())} would become Folder ({fallbacks}), "
+                f"e.g. {', '.join(self.fallback_examples)}."
+            )
+        else:
+            lines.append("No schema fallbacks.")
+        lines.append(
+            f"Estimated {self.commits} commits / {self.round_trips} round trips, "
+            f"about {_format_duration(self.estimated_seconds)}."
+        )
+        return ' '.join(lines)
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(math.ceil(seconds)), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def _subtree_levels(index, root_id):
+    """Entities per level below root_id, as copied by one clone worker."""
+    levels = []
+    level = [root_id]
+    while level:
+        nodes = [child for parent_id in level for child in index.children_of(parent_id)]
+        if not nodes:
+            break
+        levels.append(len(nodes))
+        level = [node.id for node in nodes if node.entity_type not in LEAF_ENTITY_TYPES]
+    return levels
+
+
+def plan_copy(index, schema, batch_size, workers=1):
+    """Walks the index exactly like CloneEngine and estimates the copy cost."""
+    plan = CopyPlan()
+    level = [index.project_id]
+    while level:
+        nodes = [child for parent_id in level for child in index.children_of(parent_id)]
+        if not nodes:
+            break
+        plan.levels.append(len(nodes))
+
+        level = []
+        for node in nodes:
+            plan.counts[node.entity_type] += 1
+            if node.entity_type != 'Folder' and schema.resolve_entity_type(node) == 'Folder':
+                plan.fallbacks[schema.object_type_names.get(node.object_type_id, node.entity_type)] += 1
+                if len(plan.fallback_examples) < MAX_FALLBACK_EXAMPLES:
+                    plan.fallback_examples.append(node.name)
+            if node.entity_type not in LEAF_ENTITY_TYPES:
+                level.append(node.id)
+
+    latency = DEFAULT_ROUND_TRIP_SECONDS
+    if index.round_trips and index.prefetch_seconds:
+        latency = index.prefetch_seconds / index.round_trips
+
+    def cost(commits, entities):
+        return commits * latency + entities * SECONDS_PER_ENTITY
+
+    workers = min(max(1, int(workers)), MAX_WORKERS)
+    if workers > 1 and plan.levels:
+        # Like CloneEngine._clone_parallel: the first level is created on the
+        # job's session, then every top-level subtree is batched on its own.
+        first_commits = math.ceil(plan.levels[0] / batch_size)
+        subtrees = [
+            _subtree_levels(index, node.id) for node in index.children_of(index.project_id)
+            if node.entity_type not in LEAF_ENTITY_TYPES
+        ]
+        subtree_commits = [sum(math.ceil(count / batch_size) for count in levels) for levels in subtrees]
+        subtree_seconds = [cost(commits, sum(levels)) for commits, levels in zip(subtree_commits, subtrees)]
+        copy_commits = first_commits + sum(subtree_commits)
+        # The workers share the subtrees; the largest one bounds the wall time.
+        parallel_seconds = max([sum(subtree_seconds) / workers] + subtree_seconds)
+        copy_seconds = cost(first_commits, plan.levels[0]) + parallel_seconds
+    else:
+        copy_commits = sum(math.ceil(count / batch_size) for count in plan.levels)
+        copy_seconds = cost(copy_commits, plan.total)
+
+    plan.commits = copy_commits + FIXED_COMMITS
+    plan.round_trips = index.round_trips + plan.commits
+    plan.estimated_seconds = index.prefetch_seconds + FIXED_COMMITS * latency + copy_seconds
+    return plan
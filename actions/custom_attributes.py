@@ -0,0 +1,116 @@
+"""
+Custom Attributes Module
+Bulk custom attribute writes for the project copy.
+Instead of entity['custom_attributes'][key] = value (which loads the
+attribute collection per entity), values are pushed as raw
+ContextCustomAttributeValue update operations, so they are sent in the same
+commit as the entity creation. Values equal to the configuration default
+are skipped, except for hierarchical attributes, where an explicit value
+overrides the one inherited from the parent.
+"""
+
+import collections
+import json
+import logging
+
+import ftrack_api
+
+logger = logging.getLogger(__name__)
+
+# CustomAttributeConfiguration.entity_type of project and TypedContext attributes.
+PROJECT_ENTITY_TYPE = 'show'
+CONTEXT_ENTITY_TYPE = 'task'
+
+
+class _Configuration:
+    __slots__ = ('id', 'key', 'default', 'hierarchical')
+
+    def __init__(self, configuration):
+        self.id = configuration['id']
+        self.key = configuration['key']
+        self.default = configuration['default']
+        self.hierarchical = bool(configuration['is_hierarchical'])
+
+    def is_default(self, value):
+        if self.hierarchical:
+            # Set on purpose; skipping it would inherit the parent's value instead.
+            return False
+        if value == self.default:
+            return True
+        # Some server versions return the default JSON encoded.
+        if isinstance(self.default, str):
+            try:
+                return json.loads(self.default) == value
+            except ValueError:
+                return False
+        return False
+
+
+class AttributeConfigurations:
+    """Custom attribute configurations indexed by object type and key.
+
+    Hierarchical attributes apply to the project and every TypedContext,
+    whatever its object type.
+    """
+
+    def __init__(self, session):
+        self._by_object_type = {}
+        self._project = {}
+        self._hierarchical = {}
+        for configuration in session.query(
+            'select id, key, default, entity_type, object_type_id, is_hierarchical '
+            'from CustomAttributeConfiguration'
+        ):
+            entry = _Configuration(configuration)
+            if entry.hierarchical:
+                self._hierarchical[entry.key] = entry
+                self._project.setdefault(entry.key, entry)
+            elif configuration['entity_type'] == PROJECT_ENTITY_TYPE:
+                self._project[entry.key] = entry
+            elif configuration['entity_type'] == CONTEXT_ENTITY_TYPE:
+                self._by_object_type[(configuration['object_type_id'], entry.key)] = entry
+
+        # Object type of the generic Folder used for schema fallbacks.
+        folder_type = session.query('select id from ObjectType where name is "Folder"').first()
+        self.folder_object_type_id = folder_type['id'] if folder_type else None
+        logger.info(
+            f"Loaded {len(self._by_object_type) + len(self._project)} custom attribute configurations "
+            f"({len(self._hierarchical)} hierarchical)."
+        )
+
+    def get(self, object_type_id, key):
+        """Configuration for key on an object type, or None when it does not apply."""
+        return self._by_object_type.get((object_type_id, key)) or self._hierarchical.get(key)
+
+    def get_project(self, key):
+        return self._project.get(key)
+
+    def push_values(self, session, entity_id, values, object_type_id=None):
+        """Records update operations for every non-default value of an entity.
+
+        object_type_id=None targets project level attributes. Returns the
+        number of operations recorded; they are sent with the next commit.
+        """
+        pushed = 0
+        for key, value in values.items():
+            if object_type_id is None:
+                configuration = self.get_project(key)
+            else:
+                configuration = self.get(object_type_id, key)
+            # Only write attributes that exist on the target type and differ from the default.
+            if not configuration or configuration.is_default(value):
+                continue
+            session.recorded_operations.push(
+                ftrack_api.operation.UpdateEntityOperation(
+                    'ContextCustomAttributeValue',
+                    collections.OrderedDict([
+                        ('configuration_id', configuration.id),
+                        ('entity_id', entity_id),
+                    ]),
+                    'value',
+                    ftrack_api.symbol.NOT_SET,
+                    value
+                )
+            )
+            pushed += 1
+        return pushed
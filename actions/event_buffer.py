@@ -0,0 +1,163 @@
+"""
+Event Buffer Module
+Durable queue of event entities that were held back by a project copy lock.
+Listeners capture the entities they would have processed into an append-only
+JSONL file under STATE_DIR; a background thread replays them in arrival order,
+deduplicated by entity, once the copy lock of their project is released.
+Replay is rate limited so a large backlog does not hit the server all at once.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from actions.copy_journal import STATE_DIR
+from actions.copy_lock import event_project_id, is_copy_in_progress
+from actions.metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+BUFFER_DIR = os.path.join(STATE_DIR, 'event_buffers')
+
+# Buffered entities replayed per second.
+REPLAY_RATE = float(os.getenv('FTRACK_REPLAY_RATE', '5'))
+
+# Seconds between two checks for released projects.
+REPLAY_POLL_SECONDS = float(os.getenv('FTRACK_REPLAY_POLL_SECONDS', '10'))
+
+
+def _entity_key(entity):
+    return (
+        entity.get('entity_type') or entity.get('entityType'),
+        entity.get('entityId') or entity.get('id'),
+        entity.get('action') or entity.get('operation'),
+    )
+
+
+class EventBuffer:
+    """On-disk buffer of one listener, replayed through replay(entity)."""
+
+    def __init__(self, name, replay, rate=REPLAY_RATE, poll_seconds=REPLAY_POLL_SECONDS,
+                 buffer_dir=BUFFER_DIR):
+        self.name = name
+        self.replay = replay
+        self.rate = rate
+        self.poll_seconds = poll_seconds
+        self.path = os.path.join(buffer_dir, f'{name}.jsonl')
+        self._lock = threading.Lock()
+        self._thread = None
+        QUEUE_DEPTH.set_function(self.pending, queue=f'event-buffer-{name}')
+        self.logger = logging.getLogger(
+            __name__ + '.' + self.__class__.__name__
+        )
+
+    def capture(self, entity):
+        """Appends an entity held back by the copy lock."""
+        record = {'project_id': event_project_id(entity), 'entity': entity}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        self.logger.info(
+            f"[{self.name}] Buffered {_entity_key(entity)} until the copy of project "
+            f"{record['project_id']} finishes."
+        )
+
+    def start(self):
+        """Starts the replay thread (once per process)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=f'event-replay-{self.name}', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.replay_released()
+            except Exception as e:
+                self.logger.exception(f"[{self.name}] Replay pass failed: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A torn last line from a crash mid-write.
+                self.logger.warning(f"[{self.name}] Dropping unreadable buffered event.")
+        return records
+
+    def pending(self):
+        """Number of buffered entities, including duplicates not replayed yet."""
+        with self._lock:
+            return len(self._load())
+
+    def replay_released(self):
+        """Replays the buffered entities of every project that is no longer locked."""
+        with self._lock:
+            records = self._load()
+        if not records:
+            return 0
+
+        released = []
+        for record in records:
+            project_id = record['project_id']
+            if project_id not in released and not is_copy_in_progress(project_id):
+                released.append(project_id)
+
+        replayed = 0
+        # Records of the snapshot still in the file; anything after them arrived during replay.
+        snapshot_count = len(records)
+        for project_id in released:
+            seen = set()
+            for record in records:
+                if record['project_id'] != project_id:
+                    continue
+                key = _entity_key(record['entity'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                try:
+                    self.replay(record['entity'])
+                except Exception as e:
+                    self.logger.exception(f"[{self.name}] Failed to replay {key}: {e}")
+                replayed += 1
+                if self.rate > 0:
+                    time.sleep(1.0 / self.rate)
+
+            snapshot_count -= self._discard(snapshot_count, project_id)
+            self.logger.info(f"[{self.name}] Replayed {len(seen)} buffered entities of project {project_id}.")
+        return replayed
+
+    def _discard(self, snapshot_count, project_id):
+        """Drops a project's replayed records, keeping anything captured since.
+
+        Returns the number of records removed.
+        """
+        with self._lock:
+            records = self._load()
+            kept = [
+                record for position, record in enumerate(records)
+                if position >= snapshot_count or record['project_id'] != project_id
+            ]
+            if not kept:
+                os.remove(self.path)
+                return len(records)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in kept:
+                    f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return len(records) - len(kept)
@@ -0,0 +1,110 @@
+"""
+Event Hub Loop Module
+Shared wait loop for every listener. Waits on the event hub in short slices,
+reconnects with jittered exponential backoff when the connection drops
+(reconnect() re-subscribes every registered handler) and, once connected
+again, runs a catch-up that replays entities created during the outage, so
+events are not lost across reconnects.
+"""
+
+import datetime
+import logging
+import os
+import random
+import time
+
+import ftrack_api
+
+from actions.metrics import EVENT_HUB_CONNECTED
+
+logger = logging.getLogger(__name__)
+
+# Reconnect delays: random between 0 and base * 2^attempt, capped at max ("full jitter").
+RECONNECT_BASE_SECONDS = float(os.getenv('FTRACK_RECONNECT_BASE_SECONDS', '2'))
+RECONNECT_MAX_SECONDS = float(os.getenv('FTRACK_RECONNECT_MAX_SECONDS', '60'))
+
+# Seconds of a single wait() call between two connection checks.
+WAIT_SLICE_SECONDS = 5
+
+# Extra seconds looked back by the catch-up, for clock skew and in-flight events.
+CATCH_UP_MARGIN_SECONDS = float(os.getenv('FTRACK_CATCH_UP_MARGIN_SECONDS', '60'))
+
+# Attributes holding the creation time of an entity, by preference.
+CREATION_DATE_ATTRIBUTES = ('created_at', 'date')
+
+
+def _reconnect_delay(attempt):
+    return random.uniform(0, min(RECONNECT_BASE_SECONDS * (2 ** attempt), RECONNECT_MAX_SECONDS))
+
+
+def created_since(session, entity_type, since):
+    """Yields (id, project_id) of entities of entity_type created after since (UTC).
+
+    Yields nothing if the entity type has no creation date attribute.
+    """
+    if entity_type not in session.types:
+        return
+    attributes = session.types[entity_type].attributes
+    date_attribute = next(
+        (name for name in CREATION_DATE_ATTRIBUTES if attributes.get(name) is not None), None
+    )
+    if date_attribute is None:
+        logger.debug(f"{entity_type} has no creation date; it is not caught up.")
+        return
+    project_attribute = 'project_id' if attributes.get('project_id') is not None else None
+    select = f'select id{", " + project_attribute if project_attribute else ""} from {entity_type}'
+    for entity in session.query(f'{select} where {date_attribute} > "{since.strftime("%Y-%m-%dT%H:%M:%S")}"'):
+        yield entity['id'], entity[project_attribute] if project_attribute else None
+
+
+def catch_up_entity(entity_type, entity_id, project_id=None):
+    """Builds an ftrack.update style event entity announcing the creation of one entity."""
+    entity = {'action': 'add', 'entity_type': entity_type, 'entityId': entity_id}
+    if project_id:
+        entity['parents'] = [{'entityType': 'show', 'entityId': project_id}]
+    return entity
+
+
+def run_event_loop(session, label, catch_up=None):
+    """Waits for events on session.event_hub forever, reconnecting after failures.
+
+    catch_up -- optional callable(since) run after a reconnect with the UTC
+                time the connection was last known to be up.
+    """
+    hub = session.event_hub
+    attempt = 0
+    last_connected_at = None
+    outage = False
+
+    while True:
+        try:
+            EVENT_HUB_CONNECTED.set(int(hub.connected), hub=label)
+            if not hub.connected:
+                if not outage:
+                    logger.warning(f"[{label} EVENT HUB] Connection lost. Reconnecting...")
+                    outage = True
+                # Re-subscribes every registered handler on success.
+                hub.reconnect(attempts=1, delay=0)
+                EVENT_HUB_CONNECTED.set(1, hub=label)
+                logger.info(f"[{label} EVENT HUB] Reconnected after {attempt + 1} attempt(s).")
+
+            if outage:
+                outage = False
+                attempt = 0
+                if catch_up and last_connected_at:
+                    since = last_connected_at - datetime.timedelta(seconds=CATCH_UP_MARGIN_SECONDS)
+                    logger.info(f"[{label} EVENT HUB] Catching up on entities created since {since} UTC.")
+                    catch_up(since)
+
+            last_connected_at = datetime.datetime.utcnow()
+            hub.wait(WAIT_SLICE_SECONDS)
+        except Exception as exc:
+            outage = True
+            EVENT_HUB_CONNECTED.set(0, hub=label)
+            delay = _reconnect_delay(attempt)
+            attempt += 1
+            if isinstance(exc, ftrack_api.exception.EventHubConnectionError):
+                logger.error(f"[{label} EVENT HUB] Connection error: {exc}. Retrying in {delay:.1f} seconds.")
+            else:
+                logger.exception(f"[{label} EVENT HUB] Unexpected error: {exc}. Retrying in {delay:.1f} seconds.")
+            time.sleep(delay)
@@ -0,0 +1,192 @@
+"""
+Event Router Module
+Optional single hub mode: one event hub connection receives the events of
+every action and routes them to the actions' handlers by subscription (the
+event hub's own subscriber matching) and, optionally, by entity type (see
+subscribe(), which also filters by entity type on a plain session). Each
+event is received and decoded once instead of once per action process.
+Every action keeps its own API session and runs its handlers on its own
+worker, so a slow handler does not hold up the other actions; return values
+are sent back with publish_reply, as the event hub does for a synchronous
+handler.
+"""
+
+import concurrent.futures
+import collections
+import functools
+import logging
+import threading
+
+import ftrack_api
+
+from actions.metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+# Topics the API session uses internally; their subscriptions stay on the action's own hub.
+LOCAL_TOPIC_PREFIX = 'ftrack.api.'
+
+
+def _entity_type_names(entity):
+    return {
+        (entity.get(key) or '').lower() for key in ('entity_type', 'entityType')
+    }
+
+
+def filter_entities(event, entity_types):
+    """Returns a copy of event holding only the entities of entity_types (lower case names,
+    matched against entity_type and entityType), or None if none of them is left.
+    """
+    entities = [
+        entity for entity in event['data'].get('entities', [])
+        if _entity_type_names(entity) & entity_types
+    ]
+    if not entities:
+        return None
+    # A copy, as other handlers receive the same event.
+    return dict(event, data=dict(event['data'], entities=entities))
+
+
+def subscribe(session, subscription, callback, entity_types=None, **kwargs):
+    """Subscribes callback to session's event hub, passing on only entities of entity_types.
+
+    On a routed session the router filters before the event reaches the
+    action's worker; on a plain session the callback is wrapped.
+    """
+    hub = session.event_hub
+    if not entity_types:
+        return hub.subscribe(subscription, callback, **kwargs)
+    entity_types = frozenset(entity_type.lower() for entity_type in entity_types)
+    if isinstance(hub, RoutedEventHub):
+        return hub.subscribe(subscription, callback, entity_types=entity_types, **kwargs)
+
+    @functools.wraps(callback)
+    def filtered(event):
+        event = filter_entities(event, entity_types)
+        if event is not None:
+            return callback(event)
+
+    return hub.subscribe(subscription, filtered, **kwargs)
+
+
+class RoutedEventHub:
+    """Event hub facade of one action.
+
+    Subscriptions and asynchronous publishes go through the shared
+    connection; synchronous publishes and API-internal topics stay on the
+    session's own, unconnected hub.
+    """
+
+    def __init__(self, router, name, local_hub):
+        self._router = router
+        self._name = name
+        self._local_hub = local_hub
+
+    def subscribe(self, subscription, callback, subscriber=None, priority=100, entity_types=None):
+        if LOCAL_TOPIC_PREFIX in subscription:
+            return self._local_hub.subscribe(subscription, callback, subscriber=subscriber, priority=priority)
+        return self._router.subscribe(
+            self._name, subscription, callback,
+            subscriber=subscriber, priority=priority, entity_types=entity_types
+        )
+
+    def publish(self, event, synchronous=False, **kwargs):
+        if synchronous:
+            return self._local_hub.publish(event, synchronous=True, **kwargs)
+        return self._router.hub.publish(event, **kwargs)
+
+    def publish_reply(self, source_event, data, source=None):
+        return self._router.hub.publish_reply(source_event, data, source=source)
+
+    def wait(self, duration=None):
+        return self._router.hub.wait(duration)
+
+    @property
+    def connected(self):
+        # Events arrive through the shared connection; the session's own hub never connects.
+        return self._router.hub.connected
+
+    def __getattr__(self, name):
+        # Lifecycle (connect, disconnect...) stays with the session's own hub.
+        return getattr(self._local_hub, name)
+
+
+class RoutedSession(ftrack_api.Session):
+    """API session of one action whose event hub is routed through the shared connection."""
+
+    def __init__(self, router, name, **kwargs):
+        self._routed_event_hub = None
+        super().__init__(auto_connect_event_hub=False, **kwargs)
+        self._routed_event_hub = RoutedEventHub(router, name, self._event_hub)
+
+    @property
+    def event_hub(self):
+        # The session's own hub while it is being constructed.
+        return self._routed_event_hub or self._event_hub
+
+
+class EventRouter:
+    """Routes the events of one event hub connection to the handlers of several actions."""
+
+    def __init__(self, session):
+        # Owns the single event hub connection.
+        self.session = session
+        self.hub = session.event_hub
+        self._workers = {}
+        # Events routed to each action and not handled yet
+        self._pending = collections.Counter()
+        self._pending_lock = threading.Lock()
+        self.logger = logging.getLogger(
+            __name__ + '.' + self.__class__.__name__
+        )
+
+    def session_for(self, name, **session_kwargs):
+        """Creates the API session of one action."""
+        return RoutedSession(self, name, **session_kwargs)
+
+    def subscribe(self, name, subscription, callback, subscriber=None, priority=100, entity_types=None):
+        """Routes events matching subscription to callback on the worker of action name.
+
+        entity_types -- if set, only entities of these types are passed on and
+                        events without any of them are not routed at all.
+        """
+        if name not in self._workers:
+            # One worker per action: its handlers share one session, which is not thread safe.
+            self._workers[name] = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f'router-{name}'
+            )
+            QUEUE_DEPTH.set_function(functools.partial(self.pending, name), queue=f'router-{name}')
+        route = functools.partial(
+            self._route, name, self._workers[name], callback,
+            frozenset(entity_type.lower() for entity_type in entity_types) if entity_types else None
+        )
+        self.logger.info(f"Routing '{subscription}' to {name}.")
+        return self.hub.subscribe(subscription, route, subscriber=subscriber, priority=priority)
+
+    def _route(self, name, worker, callback, entity_types, event):
+        if entity_types is not None:
+            event = filter_entities(event, entity_types)
+            if event is None:
+                return
+        with self._pending_lock:
+            self._pending[name] += 1
+        worker.submit(self._dispatch, name, callback, event)
+
+    def pending(self, name):
+        with self._pending_lock:
+            return self._pending[name]
+
+    def _dispatch(self, name, callback, event):
+        try:
+            result = callback(event)
+        except Exception as e:
+            self.logger.exception(f"[{name}] Handler failed for {event.get('topic')}: {e}")
+            return
+        finally:
+            with self._pending_lock:
+                self._pending[name] -= 1
+        if result is not None:
+            self.hub.publish_reply(event, data=result)
+
+    def wait(self):
+        self.hub.wait()
@@ -0,0 +1,141 @@
+"""
+Health Server Module
+Lightweight HTTP server of the supervisor process:
+  /healthz  200 while every listener process is alive and its event hubs
+            are connected, 503 otherwise
+  /readyz   200 once every listener has registered its handlers and is
+            reporting metrics, 503 otherwise
+  /metrics  Prometheus metrics of every listener plus the supervisor's own
+            process and restart metrics
+"""
+
+import http.server
+import json
+import logging
+import os
+import threading
+
+from actions.metrics import REPORT_SECONDS, render
+
+logger = logging.getLogger(__name__)
+
+HEALTH_HOST = os.getenv('FTRACK_HEALTH_HOST', '0.0.0.0')
+HEALTH_PORT = int(os.getenv('FTRACK_HEALTH_PORT', '8004'))
+
+# A listener whose last metrics snapshot is older than this counts as unresponsive.
+STALE_SECONDS = 3 * REPORT_SECONDS
+
+
+def _gauge(help, values):
+    return {'kind': 'gauge', 'help': help, 'values': values}
+
+
+class HealthServer:
+    """Serves the health, readiness and metrics endpoints of a Supervisor."""
+
+    def __init__(self, supervisor, collector, host=HEALTH_HOST, port=HEALTH_PORT):
+        self.supervisor = supervisor
+        self.collector = collector
+        self.host = host
+        self.port = port
+        self._server = None
+        self.logger = logging.getLogger(
+            __name__ + '.' + self.__class__.__name__
+        )
+
+    def start(self):
+        health = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                routes = {'/healthz': health.healthz, '/readyz': health.readyz, '/metrics': health.metrics}
+                route = routes.get(self.path.split('?', 1)[0])
+                if route is None:
+                    self._send(404, 'text/plain', 'Not found\n')
+                    return
+                try:
+                    self._send(*route())
+                except Exception as e:
+                    health.logger.exception(f"Failed to serve {self.path}: {e}")
+                    self._send(500, 'text/plain', 'Internal error\n')
+
+            def _send(self, status, content_type, body):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # Probes hit these endpoints every few seconds.
+                health.logger.debug(format % args)
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='health-server', daemon=True).start()
+        self.logger.info(f"Health server listening on {self.host}:{self.port}.")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def status(self):
+        """Health of every listener, from its process and its latest metrics snapshot."""
+        snapshots = self.collector.snapshots(max_age=STALE_SECONDS)
+        listeners = {}
+        for listener in self.supervisor.listeners:
+            snapshot = snapshots.get(listener.name, {})
+            hubs = {
+                dict(key).get('hub', listener.name): bool(value)
+                for key, value in snapshot.get('ftrack_event_hub_connected', {}).get('values', {}).items()
+            }
+            ready = snapshot.get('ftrack_listener_ready', {}).get('values', {})
+            listeners[listener.name] = {
+                'alive': listener.alive,
+                'given_up': listener.given_up,
+                'restarts': listener.restarts,
+                'reporting': bool(snapshot),
+                'event_hubs': hubs,
+                'ready': bool(ready) and all(ready.values()),
+            }
+        return listeners
+
+    def healthz(self):
+        listeners = self.status()
+        healthy = all(
+            status['alive'] and status['reporting'] and all(status['event_hubs'].values())
+            for status in listeners.values()
+        )
+        return self._json(healthy, listeners)
+
+    def readyz(self):
+        listeners = self.status()
+        ready = all(status['alive'] and status['ready'] and status['reporting'] for status in listeners.values())
+        return self._json(ready, listeners)
+
+    def _json(self, ok, listeners):
+        body = json.dumps({'status': 'ok' if ok else 'failing', 'listeners': listeners}, indent=2)
+        return (200 if ok else 503), 'application/json', body + '\n'
+
+    def metrics(self):
+        listeners = self.supervisor.listeners
+        supervisor = {
+            'ftrack_listener_up': _gauge(
+                '1 while the listener process is alive.',
+                {(('listener', listener.name),): int(listener.alive) for listener in listeners},
+            ),
+            'ftrack_listener_given_up': _gauge(
+                '1 once the listener crash looped and is no longer restarted.',
+                {(('listener', listener.name),): int(listener.given_up) for listener in listeners},
+            ),
+            'ftrack_listener_restarts_total': {
+                'kind': 'counter',
+                'help': 'Restarts of the listener process by the supervisor.',
+                'values': {(('listener', listener.name),): listener.restarts for listener in listeners},
+            },
+        }
+        snapshots = {'': supervisor}
+        snapshots.update(self.collector.snapshots(max_age=STALE_SECONDS))
+        return 200, 'text/plain; version=0.0.4; charset=utf-8', render(snapshots)
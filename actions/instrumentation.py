@@ -0,0 +1,248 @@
+"""
+Instrumentation Module
+Measures what every event costs. instrument() wraps the callbacks an action
+subscribes and its session's query/get/commit/populate calls; for each
+handled event it records the wall time, the server round trips (by session
+method) and the bytes sent and received into histograms of the metrics
+registry, and writes one structured JSON log line. Background work that is
+not a callback (e.g. a batch of the template batcher) is measured the same
+way with measure().
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import threading
+import time
+import weakref
+
+from actions.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# One JSON line per handled event; raise this logger's level to silence them.
+event_logger = logging.getLogger(__name__ + '.events')
+
+# Session methods whose server calls are attributed to them.
+SESSION_METHODS = ('query', 'get', 'commit', 'populate')
+
+# query() returns a lazy result; its cost shows up in the server calls labelled 'query'.
+TIMED_SESSION_METHODS = ('get', 'commit', 'populate')
+
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500)
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+EVENTS = REGISTRY.counter('ftrack_events_total', 'Events handled, by action and handler.')
+EVENT_ERRORS = REGISTRY.counter('ftrack_event_errors_total', 'Events whose handler raised, by action and handler.')
+EVENT_DURATION = REGISTRY.histogram('ftrack_event_duration_seconds', 'Handler wall time per event.')
+EVENT_SERVER_CALLS = REGISTRY.histogram(
+    'ftrack_event_server_calls', 'Round trips to the ftrack server per event.', buckets=COUNT_BUCKETS
+)
+EVENT_SERVER_BYTES = REGISTRY.histogram(
+    'ftrack_event_server_bytes', 'Bytes sent to and received from the ftrack server per event.', buckets=BYTE_BUCKETS
+)
+SERVER_CALLS = REGISTRY.counter('ftrack_server_calls_total', 'Round trips to the ftrack server, by action and method.')
+SERVER_OPERATIONS = REGISTRY.counter(
+    'ftrack_server_operations_total', 'Operations (queries, creates, updates...) sent to the ftrack server.'
+)
+SERVER_CALL_DURATION = REGISTRY.histogram(
+    'ftrack_server_call_duration_seconds', 'Wall time of one round trip to the ftrack server, by method.'
+)
+SERVER_BYTES = REGISTRY.counter('ftrack_server_bytes_total', 'Bytes exchanged with the ftrack server, by direction.')
+SESSION_METHOD_DURATION = REGISTRY.histogram(
+    'ftrack_session_method_duration_seconds', 'Wall time of session get, commit and populate calls.'
+)
+
+# Instrumented session -> action name
+_actions = weakref.WeakKeyDictionary()
+
+# Per thread: the events being handled (innermost last) and the session method being run.
+_local = threading.local()
+
+
+def _active():
+    if not hasattr(_local, 'stats'):
+        _local.stats = []
+    return _local.stats
+
+
+class EventStats:
+    """Cost of one handled event or unit of background work."""
+
+    def __init__(self, action, handler, event=None):
+        self.action = action
+        self.handler = handler
+        self.topic = event.get('topic') if event else None
+        self.event_id = event.get('id') if event else None
+        self.started = time.monotonic()
+        self.server_calls = 0
+        self.server_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # method -> [round trips, seconds]
+        self.methods = {}
+
+    def add_call(self, method, seconds):
+        self.server_calls += 1
+        self.server_seconds += seconds
+        calls = self.methods.setdefault(method, [0, 0.0])
+        calls[0] += 1
+        calls[1] += seconds
+
+    def finish(self, error=None):
+        duration = time.monotonic() - self.started
+        labels = {'action': self.action, 'handler': self.handler}
+        EVENTS.inc(**labels)
+        if error is not None:
+            EVENT_ERRORS.inc(**labels)
+        EVENT_DURATION.observe(duration, **labels)
+        EVENT_SERVER_CALLS.observe(self.server_calls, **labels)
+        EVENT_SERVER_BYTES.observe(self.bytes_sent + self.bytes_received, **labels)
+        event_logger.info(json.dumps({
+            'action': self.action,
+            'handler': self.handler,
+            'topic': self.topic,
+            'event_id': self.event_id,
+            'duration_ms': round(duration * 1000, 1),
+            'server_calls': self.server_calls,
+            'server_ms': round(self.server_seconds * 1000, 1),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'methods': {
+                method: {'calls': calls, 'ms': round(seconds * 1000, 1)}
+                for method, (calls, seconds) in self.methods.items()
+            },
+            'error': repr(error) if error is not None else None,
+        }, sort_keys=True))
+
+
+@contextlib.contextmanager
+def track(action, handler, event=None):
+    """Measures the block as one event of handler; the costs also count towards enclosing events."""
+    stats = EventStats(action, handler, event)
+    active = _active()
+    active.append(stats)
+    error = None
+    try:
+        yield stats
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        active.remove(stats)
+        try:
+            stats.finish(error)
+        except Exception as e:
+            logger.debug(f"Failed to record the cost of {handler}: {e}")
+
+
+def action_name(session, default=''):
+    """Name of the action an instrumented session was instrumented for."""
+    return _actions.get(session, default)
+
+
+def measure(session, handler):
+    """Measures background work done with an instrumented session, e.g. a batch of new entities."""
+    return track(action_name(session), handler)
+
+
+def handler_name(callback):
+    """Readable name of an event hub callback, e.g. AddToTodayDailiesAction.launch."""
+    while True:
+        if isinstance(callback, functools.partial):
+            callback = callback.func
+        elif hasattr(callback, '__wrapped__'):
+            # e.g. the entity type filter of event_router.subscribe
+            callback = callback.__wrapped__
+        else:
+            break
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+
+def _body_size(body):
+    if not body:
+        return 0
+    return len(body.encode('utf-8')) if isinstance(body, str) else len(body)
+
+
+def _session_method(action, method, fn):
+    """Wraps a session method so the server calls it makes are attributed to it."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'method', None):
+            # Called by another session method, e.g. get() running a query.
+            return fn(*args, **kwargs)
+        _local.method = method
+        started = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.method = None
+            if method in TIMED_SESSION_METHODS:
+                SESSION_METHOD_DURATION.observe(time.monotonic() - started, action=action, method=method)
+
+    return wrapper
+
+
+def instrument(session, action):
+    """Measures the callbacks subscribed through session and the server calls it makes.
+
+    Must be called before the action subscribes its handlers. Sessions that
+    are already instrumented are left as they are.
+    """
+    if session in _actions:
+        return
+    _actions[session] = action
+
+    hub = session.event_hub
+    subscribe = hub.subscribe
+    call = session.call
+
+    @functools.wraps(subscribe)
+    def instrumented_subscribe(subscription, callback, *args, **kwargs):
+        handler = handler_name(callback)
+
+        @functools.wraps(callback)
+        def instrumented_callback(event):
+            with track(action, handler, event):
+                return callback(event)
+
+        return subscribe(subscription, instrumented_callback, *args, **kwargs)
+
+    @functools.wraps(call)
+    def instrumented_call(data):
+        # Lazy query results are fetched outside of query() itself.
+        method = getattr(_local, 'method', None) or (data[0].get('action') if data else None) or 'call'
+        started = time.monotonic()
+        try:
+            return call(data)
+        finally:
+            seconds = time.monotonic() - started
+            SERVER_CALLS.inc(action=action, method=method)
+            SERVER_OPERATIONS.inc(len(data), action=action)
+            SERVER_CALL_DURATION.observe(seconds, action=action, method=method)
+            for stats in _active():
+                stats.add_call(method, seconds)
+
+    def count_bytes(response, *args, **kwargs):
+        sent = _body_size(response.request.body)
+        received = int(response.headers.get('Content-Length') or len(response.content))
+        SERVER_BYTES.inc(sent, action=action, direction='sent')
+        SERVER_BYTES.inc(received, action=action, direction='received')
+        for stats in _active():
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+
+    hub.subscribe = instrumented_subscribe
+    session.call = instrumented_call
+    for method in SESSION_METHODS:
+        setattr(session, method, _session_method(action, method, getattr(session, method)))
+
+    # The requests session the API sends its calls through.
+    request = getattr(session, '_request', None)
+    if request is not None:
+        request.hooks['response'].append(count_bytes)
+    else:
+        logger.debug(f"Session of {action} has no request session; bytes are not counted.")
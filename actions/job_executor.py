@@ -0,0 +1,127 @@
+"""
+Job Executor Module
+Runs long action jobs (e.g. project copies) on background threads so the
+event hub callback can reply right away. The executor runs at most
+max_concurrent jobs at once, queues up to max_queued more and rejects the
+rest. Jobs are cancelled cooperatively through a threading.Event.
+The IDs of the jobs queued or running are kept in a file under STATE_DIR,
+so the jobs a restart interrupted can be found and closed afterwards.
+"""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from actions.copy_journal import STATE_DIR
+from actions.metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.path.join(STATE_DIR, 'jobs')
+
+MAX_CONCURRENT_JOBS = int(os.getenv('FTRACK_MAX_CONCURRENT_JOBS', '2'))
+MAX_QUEUED_JOBS = int(os.getenv('FTRACK_MAX_QUEUED_JOBS', '8'))
+
+
+class _JobHandle:
+    def __init__(self, job_id, label):
+        self.job_id = job_id
+        self.label = label
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.started = False
+
+
+class JobExecutor:
+    """Bounded background executor with per-job cancellation."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS, name='job',
+                 jobs_dir=JOBS_DIR):
+        self.max_concurrent = max(1, max_concurrent)
+        self.capacity = self.max_concurrent + max(0, max_queued)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix=name)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.path = os.path.join(jobs_dir, f'{name}.json')
+        # Jobs left queued or running by the previous process, until forget_interrupted().
+        self.interrupted = self._load()
+        QUEUE_DEPTH.set_function(self.queue_depth, queue=f'job-executor-{name}')
+
+    def submit(self, job_id, label, fn, *args):
+        """Schedules fn(cancel_event, *args) for job_id.
+
+        fn is called even when the job was cancelled while queued, so it can
+        record the outcome; it checks cancel_event itself. Returns False
+        without scheduling anything when the queue is full.
+        """
+        with self._lock:
+            if len(self._jobs) >= self.capacity:
+                logger.warning(f"Job queue full ({self.capacity}); rejecting job {job_id}.")
+                return False
+            handle = _JobHandle(job_id, label)
+            self._jobs[job_id] = handle
+            handle.future = self._pool.submit(self._run, handle, fn, args)
+            self._save()
+        logger.info(f"Queued job {job_id} ({label}); {len(self._jobs)} active or queued.")
+        return True
+
+    def _run(self, handle, fn, args):
+        handle.started = True
+        try:
+            fn(handle.cancel_event, *args)
+        except Exception:
+            logger.exception(f"Unhandled error in background job {handle.job_id}.")
+        finally:
+            with self._lock:
+                self._jobs.pop(handle.job_id, None)
+                self._save()
+
+    def cancel(self, job_id):
+        """Requests cancellation. Returns False if the job is not known."""
+        with self._lock:
+            handle = self._jobs.get(job_id)
+        if not handle:
+            return False
+        handle.cancel_event.set()
+        logger.info(f"Cancellation requested for job {job_id}.")
+        return True
+
+    def active_jobs(self):
+        """Returns (job_id, label, started) for every running or queued job."""
+        with self._lock:
+            return [(h.job_id, h.label, h.started) for h in self._jobs.values()]
+
+    def queue_depth(self):
+        """Number of jobs waiting for a free slot."""
+        with self._lock:
+            return sum(1 for handle in self._jobs.values() if not handle.started)
+
+    def forget_interrupted(self):
+        """Drops the interrupted jobs once they have been closed."""
+        with self._lock:
+            self.interrupted = []
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                job_ids = json.load(f)
+        except FileNotFoundError:
+            return []
+        except ValueError:
+            logger.warning(f"Ignoring unreadable job list: {self.path}")
+            return []
+        return [job_id for job_id in job_ids if isinstance(job_id, str)] if isinstance(job_ids, list) else []
+
+    def _save(self):
+        # Called with self._lock held; replaced atomically so a crash never leaves half a list.
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.interrupted + list(self._jobs), f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not save the job list {self.path}: {e}")
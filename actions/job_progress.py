@@ -0,0 +1,93 @@
+"""
+Job Progress Module
+Accumulates progress counters of a long-running job and writes them to
+Job['data'] at most once every FLUSH_SECONDS or FLUSH_ENTITIES processed
+entities. Writing only changes the Job in the session; the update is sent
+to the server with the next commit the job makes anyway.
+"""
+
+import json
+import os
+import time
+
+# Minimum seconds between two progress writes.
+FLUSH_SECONDS = float(os.getenv('FTRACK_PROGRESS_FLUSH_SECONDS', '5'))
+
+# Processed entities that force a progress write regardless of the interval.
+FLUSH_ENTITIES = int(os.getenv('FTRACK_PROGRESS_FLUSH_ENTITIES', '500'))
+
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+class JobProgress:
+    """Throttled progress reporter for one ftrack Job."""
+
+    def __init__(self, job, label, flush_seconds=FLUSH_SECONDS, flush_entities=FLUSH_ENTITIES):
+        self.job = job
+        self.label = label
+        self.flush_seconds = flush_seconds
+        self.flush_entities = flush_entities
+        self._started = time.monotonic()
+        self._last_flush = 0.0
+        self._last_done = 0
+
+    def stage(self, description):
+        """Writes a stage description right away (sent with the next commit)."""
+        self.job['data'] = json.dumps({'description': f"{self.label}: {description}"})
+        self._last_flush = time.monotonic()
+
+    def update_counts(self, stage, counts, force=False):
+        """Writes named counters of a pipeline stage if the throttle allows it.
+
+        Returns True when the job was changed.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_seconds:
+            return False
+        summary = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.job['data'] = json.dumps(dict(
+            counts,
+            description=f"{self.label}: {stage} ({summary})",
+            stage=stage,
+        ))
+        self._last_flush = now
+        return True
+
+    def update(self, counters, force=False):
+        """Writes counters to the job if the throttle allows it.
+
+        Returns True when the job was changed, so callers without a pending
+        commit of their own know they have to commit.
+        """
+        now = time.monotonic()
+        due = (
+            now - self._last_flush >= self.flush_seconds
+            or counters.done - self._last_done >= self.flush_entities
+        )
+        if not (force or due):
+            return False
+
+        elapsed = now - self._started
+        percent = int(100 * counters.done / counters.total) if counters.total else 100
+        remaining = max(counters.total - counters.done, 0)
+        eta = remaining * elapsed / counters.done if counters.done else None
+
+        description = f"{self.label}: {counters.done}/{counters.total} entities ({percent}%)"
+        if eta is not None and remaining:
+            description += f", about {_format_eta(eta)} left"
+
+        self.job['data'] = json.dumps({
+            'description': description,
+            'created': counters.created,
+            'fallbacks': counters.fallbacks,
+            'skipped': counters.skipped,
+            'resumed': counters.resumed,
+            'percent': percent,
+            'eta_seconds': int(eta) if eta is not None else None,
+        })
+        self._last_flush = now
+        self._last_done = counters.done
+        return True
@@ -0,0 +1,246 @@
+"""
+Metrics Module
+In-process registry of counters, gauges and histograms rendered in the
+Prometheus text format. Every listener process records into its own
+REGISTRY; a reporter thread sends snapshots of it to the supervisor over a
+multiprocessing queue, where the MetricsCollector keeps the latest snapshot
+of each listener for the health server.
+"""
+
+import bisect
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two snapshots sent by a listener process.
+REPORT_SECONDS = float(os.getenv('FTRACK_METRICS_REPORT_SECONDS', '5'))
+
+# Upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_items):
+    if not label_items:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in label_items
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        # repr keeps every significant digit; %g would round large sums and bucket bounds.
+        return '+Inf' if value == float('inf') else repr(value)
+    return str(value)
+
+
+class Metric:
+    """One metric family; its samples are keyed by their label values."""
+
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        with self._lock:
+            return {'kind': self.kind, 'help': self.help, 'values': dict(self._values)}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_function(self, fn, **labels):
+        """Reads the value from fn() whenever a snapshot is taken, e.g. a queue size."""
+        with self._lock:
+            self._functions[_label_key(labels)] = fn
+
+    def snapshot(self):
+        with self._lock:
+            functions = dict(self._functions)
+        values = {}
+        for key, fn in functions.items():
+            try:
+                values[key] = fn()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} {dict(key)} could not be read: {e}")
+        snapshot = super().snapshot()
+        snapshot['values'].update(values)
+        return snapshot
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                # Count per bucket (not cumulative), then sum and count.
+                sample = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            sample[0][bisect.bisect_left(self.buckets, value)] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            values = {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+        return {'kind': self.kind, 'help': self.help, 'buckets': self.buckets, 'values': values}
+
+
+class MetricsRegistry:
+    """The metric families of one process, by name."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name, help):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def snapshot(self):
+        """A picklable copy of every metric family."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+# Shared by the listener modules.
+QUEUE_DEPTH = REGISTRY.gauge('ftrack_queue_depth', 'Items waiting in an in-process queue.')
+EVENT_HUB_CONNECTED = REGISTRY.gauge('ftrack_event_hub_connected', '1 while the event hub is connected.')
+LISTENER_READY = REGISTRY.gauge('ftrack_listener_ready', '1 once the action has registered its handlers.')
+
+
+def start_reporter(metrics_queue, listener, interval=REPORT_SECONDS):
+    """Sends a snapshot of REGISTRY to the supervisor every interval seconds."""
+
+    def report():
+        while True:
+            try:
+                metrics_queue.put_nowait((listener, time.time(), REGISTRY.snapshot()))
+            except queue.Full:
+                pass
+            except Exception as e:
+                logger.debug(f"Metrics snapshot of {listener} was not sent: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=report, name='metrics-reporter', daemon=True)
+    thread.start()
+    return thread
+
+
+class MetricsCollector:
+    """Keeps the latest snapshot sent by each listener process."""
+
+    def __init__(self, metrics_queue):
+        self.queue = metrics_queue
+        # listener name -> (sent at, snapshot)
+        self.latest = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.logger = logging.getLogger(
+            __name__ + '.' + self.__class__.__name__
+        )
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-collector', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                listener, sent_at, snapshot = self.queue.get()
+            except Exception as e:
+                self.logger.exception(f"Failed to receive a metrics snapshot: {e}")
+                time.sleep(REPORT_SECONDS)
+                continue
+            with self._lock:
+                self.latest[listener] = (sent_at, snapshot)
+
+    def snapshots(self, max_age=None):
+        """Latest snapshot of each listener, leaving out the ones older than max_age seconds."""
+        now = time.time()
+        with self._lock:
+            return {
+                listener: snapshot for listener, (sent_at, snapshot) in self.latest.items()
+                if max_age is None or now - sent_at <= max_age
+            }
+
+
+def render(snapshots):
+    """Renders {listener: snapshot} in the Prometheus text format, labelling every sample with its listener."""
+    families = {}
+    for listener, snapshot in snapshots.items():
+        for name, family in snapshot.items():
+            families.setdefault(name, (family, []))[1].append((listener, family))
+
+    lines = []
+    for name in sorted(families):
+        first, members = families[name]
+        lines.append(f'# HELP {name} {first["help"]}')
+        lines.append(f'# TYPE {name} {first["kind"]}')
+        for listener, family in members:
+            for key, value in sorted(family['values'].items()):
+                labels = (('listener', listener),) + key if listener else key
+                if family['kind'] != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(family['buckets'] + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    bucket_labels = labels + (('le', _format_value(float(bound))),)
+                    lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,92 @@
+"""
+Reference Data Module
+Process-wide cache of rarely changing lookup data (statuses, priorities and
+task types) used by the automations. Entries are kept as plain dicts holding
+IDs, so any session or thread can use them. They expire after
+REFERENCE_DATA_TTL seconds and are dropped early when an ftrack.update event
+reports a change to one of these entity types.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds the cached lookup data is trusted.
+REFERENCE_DATA_TTL = float(os.getenv('FTRACK_REFERENCE_DATA_TTL', '600'))
+
+# Event entity types (lower case) whose changes invalidate the cache.
+CONFIGURATION_ENTITY_TYPES = ('status', 'priority', 'type', 'tasktype', 'projectschema')
+
+
+def _snapshot(entity):
+    return {'id': entity['id'], 'name': entity['name'], 'entity_type': entity.get('entity_type')}
+
+
+def _by_name(entities):
+    """Maps name -> snapshot, keeping the first entity of each name like query().first()."""
+    by_name = {}
+    for entity in entities:
+        by_name.setdefault(entity['name'], _snapshot(entity))
+    return by_name
+
+
+class ReferenceDataCache:
+    """Statuses, priorities and types by name, loaded in three queries per TTL."""
+
+    def __init__(self, ttl=REFERENCE_DATA_TTL):
+        self.ttl = ttl
+        self._statuses = {}
+        self._priorities = {}
+        self._types = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def warm(self, session):
+        """Loads the data if it is missing or expired."""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._load(session)
+
+    def _load(self, session):
+        self._statuses = _by_name(session.query('select id, name from Status'))
+        self._priorities = _by_name(session.query('select id, name from Priority'))
+        self._types = _by_name(session.query('select id, name from Type'))
+        self._loaded_at = time.monotonic()
+        logger.info(
+            f"Loaded reference data: {len(self._statuses)} statuses, "
+            f"{len(self._priorities)} priorities, {len(self._types)} types."
+        )
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def invalidate_for(self, entity):
+        """Drops the cache if an event entity is a configuration change."""
+        entity_type = (entity.get('entity_type') or entity.get('entityType') or '').lower()
+        if entity_type in CONFIGURATION_ENTITY_TYPES:
+            logger.info(f"Reference data changed ({entity_type}); reloading on next use.")
+            self.invalidate()
+            return True
+        return False
+
+    def status(self, session, name):
+        self.warm(session)
+        return self._statuses.get(name)
+
+    def priority(self, session, name):
+        self.warm(session)
+        return self._priorities.get(name)
+
+    def type(self, session, name):
+        self.warm(session)
+        return self._types.get(name)
+
+
+# Shared by every automation in the process.
+REFERENCE_DATA = ReferenceDataCache()
@@ -0,0 +1,65 @@
+"""
+Retry Scheduler Module
+Runs delayed callbacks on a single background thread, ordered by a heap of
+due times. Listeners hand it work that has to be tried again later (e.g. an
+entity that is not visible yet) instead of sleeping in the event hub thread.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from actions.metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt, base_seconds, max_seconds):
+    """Exponential backoff: base, 2 * base, 4 * base, ... capped at max_seconds."""
+    return min(base_seconds * (2 ** attempt), max_seconds)
+
+
+class RetryScheduler:
+    """Heap based scheduler calling fn(*args) once its delay has passed.
+
+    Callbacks run on the scheduler thread and should only hand work back to
+    its owner (e.g. put it on a queue), never block.
+    """
+
+    def __init__(self, name='retry-scheduler'):
+        self.name = name
+        self._heap = []
+        # Tie breaker so entries with the same due time never compare callables.
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        QUEUE_DEPTH.set_function(self.pending, queue=name)
+        self.logger = logging.getLogger(
+            __name__ + '.' + self.__class__.__name__
+        )
+
+    def schedule(self, delay, fn, *args):
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), fn, args))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def pending(self):
+        with self._condition:
+            return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                _due, _sequence, fn, args = heapq.heappop(self._heap)
+            try:
+                fn(*args)
+            except Exception as e:
+                self.logger.exception(f"[{self.name}] Scheduled callback failed: {e}")
@@ -4,7 +4,18 @@ import logging
 from dotenv import load_dotenv
 import functools # Required to pass the session correctly
 import time
-from actions.copy_lock import is_copy_in_progress 
+import collections
+import queue
+import threading
+from actions.copy_lock import is_copy_event, is_entity_locked
+from actions.event_buffer import EventBuffer
+from actions.event_hub_loop import catch_up_entity, created_since, run_event_loop
+from actions.event_router import subscribe
+from actions.instrumentation import action_name, instrument, measure
+from actions.metrics import QUEUE_DEPTH
+from actions.reference_data import CONFIGURATION_ENTITY_TYPES, REFERENCE_DATA
+from actions.retry_scheduler import RetryScheduler, backoff_delay
+from actions.task_templates import TASK_TEMPLATES
 
 # --- Configuration ---
 # Loads credentials from your .env file
@@ -14,107 +25,328 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Seconds new entities of consecutive events are collected before they are processed together.
+COALESCE_SECONDS = float(os.getenv('FTRACK_SHOT_COALESCE_SECONDS', '0.5'))
+
+# Most entities fetched and given tasks in one batch.
+MAX_SHOT_BATCH = int(os.getenv('FTRACK_SHOT_BATCH_SIZE', '100'))
+
+# Lookups of an entity that is not visible yet (commit delays), with exponential backoff.
+SHOT_RETRY_ATTEMPTS = int(os.getenv('FTRACK_SHOT_RETRY_ATTEMPTS', '5'))
+SHOT_RETRY_BASE_SECONDS = float(os.getenv('FTRACK_SHOT_RETRY_BASE_SECONDS', '1'))
+SHOT_RETRY_MAX_SECONDS = 30.0
+
+# Bids are given in hours in the templates and stored in seconds.
+SECONDS_PER_HOUR = 3600
+
+# Dispatch table: entity type of a new entity -> object type of its task template.
+TEMPLATED_ENTITY_TYPES = {
+    'Shot': 'Shot',
+    'AssetBuild': 'AssetBuild',
+    'Sequence': 'Sequence',
+    'Episode': 'Episode',
+}
+
+# Entities the ftrack.update handler looks at: new templated entities, project
+# updates ('show') and reference data changes. Others are not passed on to it.
+HANDLED_ENTITY_TYPES = tuple(TEMPLATED_ENTITY_TYPES) + ('show',) + CONFIGURATION_ENTITY_TYPES
+
+
+def _replay_entity(entity):
+    """Processes an entity that was held back by a project copy."""
+    create_tasks_for_new_shot(TEMPLATE_BATCHER.session, {'data': {'entities': [entity]}})
+
+
+# New entities of projects being copied; they get their tasks after the copy.
+EVENT_BUFFER = EventBuffer('shot_creation', _replay_entity)
+
+
+class TemplateBatcher:
+    """Collects new entities across events and processes them in batches on its own thread.
+
+    The event hub callback only queues (entity type, ID) pairs, so a burst
+    of shots from an editor conform or CSV import never blocks the listener;
+    the batcher thread is the only user of the session once started.
+    Entities that are not visible yet are re-queued by the retry scheduler
+    with backoff.
+    """
+
+    def __init__(self, window=COALESCE_SECONDS, max_batch=MAX_SHOT_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self.session = None
+        # ((entity_type, entity_id), attempt) pairs
+        self._queue = queue.Queue()
+        self._thread = None
+        self.retries = RetryScheduler('template-retry')
+        QUEUE_DEPTH.set_function(self.pending, queue='template-batcher')
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, session):
+        if self.running:
+            return
+        self.session = session
+        self._thread = threading.Thread(target=self._run, name='template-batcher', daemon=True)
+        self._thread.start()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, refs, attempt=0):
+        for ref in refs:
+            self._queue.put((ref, attempt))
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            attempts = dict(items)
+            try:
+                # The tasks are created here, not in the event callback
+                with measure(self.session, 'TemplateBatcher.create_tasks'):
+                    missing = create_tasks_for_entities(self.session, list(attempts))
+            except Exception as e:
+                logger.exception(f"CRITICAL: Failed to process a batch of {len(items)} entities. Error: {e}")
+                continue
+            for ref in missing:
+                self._retry(ref, attempts[ref] + 1)
+
+    def _retry(self, ref, attempt):
+        """Looks the entity up again later, as its creation may not be committed yet."""
+        entity_type, entity_id = ref
+        if attempt >= SHOT_RETRY_ATTEMPTS:
+            logger.error(f"Failed to fetch details for {entity_type} {entity_id} after multiple attempts. Aborting for this entity.")
+            return
+        delay = backoff_delay(attempt - 1, SHOT_RETRY_BASE_SECONDS, SHOT_RETRY_MAX_SECONDS)
+        logger.warning(f"Attempt {attempt}: {entity_type} {entity_id} not found yet. Retrying in {delay:g} seconds...")
+        self.retries.schedule(delay, self.submit, [ref], attempt)
+
+
+TEMPLATE_BATCHER = TemplateBatcher()
+
+
 def create_tasks_for_new_shot(session, event):
     """
-    Listens for ftrack.update events and creates default tasks
-    when a new 'Shot' type is created.
-    This version is idempotent and uses batch commits.
+    Listens for ftrack.update events and creates the template tasks
+    when a new entity of a type in TEMPLATED_ENTITY_TYPES (e.g. 'Shot') is created.
+    New entities are handed to the template batcher, so the callback
+    returns right away.
     """
-    # Skip processing if a project copy is in progress
-    if is_copy_in_progress():
-        logger.debug("--- Skipping event: Project copy in progress ---")
-        return
-    
     logger.info("--- Event received, processing entities... ---")
-    
+
+    refs = []
     for entity in event['data'].get('entities', []):
         logger.info(f"Inspecting entity: {entity.get('entity_type')} with action: {entity.get('action')}")
 
+        # Statuses, priorities or types were edited; drop the cached copies
+        if REFERENCE_DATA.invalidate_for(entity):
+            continue
+
+        # A project's task template attribute may have changed
+        if entity.get('entityType') == 'show' and entity.get('action') == 'update':
+            TASK_TEMPLATES.invalidate(entity.get('entityId'))
+            continue
+
+        entity_type = entity.get('entity_type')
         if (entity.get('action') == 'add' and 
-            entity.get('entity_type') == 'Shot'):
+            entity_type in TEMPLATED_ENTITY_TYPES):
 
-            shot_id = entity.get('entityId')
-            if not shot_id:
-                logger.warning("Found a new Shot entity but it had no ID. Skipping.")
+            # Hold back entities of a project that is currently being copied
+            if is_entity_locked(entity):
+                if is_copy_event(event, entity):
+                    # Created by the copy itself; replaying it would undo the lock.
+                    logger.debug(f"--- Skipping {entity_type} {entity.get('entityId')}: Created by the project copy ---")
+                    continue
+                logger.debug(f"--- Buffering {entity_type} {entity.get('entityId')}: Project copy in progress ---")
+                EVENT_BUFFER.capture(entity)
                 continue
 
-            logger.info(f"MATCH! New Shot detected with ID: {shot_id}. Fetching details...")
-            
-            shot_object = None
-            # Retry logic to handle potential database commit delays
-            for i in range(5):
-                shot_object = session.get('Shot', shot_id)
-                if shot_object:
-                    logger.info(f"Successfully fetched ftrack object on attempt {i+1}. Object Name: '{shot_object['name']}'")
-                    break
-                logger.warning(f"Attempt {i+1}: Shot object not found yet. Retrying in 1 second...")
-                time.sleep(1)
+            entity_id = entity.get('entityId')
+            if not entity_id:
+                logger.warning(f"Found a new {entity_type} entity but it had no ID. Skipping.")
+                continue
+
+            logger.info(f"MATCH! New {entity_type} detected with ID: {entity_id}.")
+            refs.append((entity_type, entity_id))
+
+    if not refs:
+        return
+    # Started by register(); started here when the callback is used on its own
+    TEMPLATE_BATCHER.start(session)
+    TEMPLATE_BATCHER.submit(refs)
+
+
+def _query_in(session, select, attribute, ids):
+    """Runs select for ids in chunks of MAX_SHOT_BATCH, yielding every result."""
+    for position in range(0, len(ids), MAX_SHOT_BATCH):
+        chunk = ', '.join(f'"{entity_id}"' for entity_id in ids[position:position + MAX_SHOT_BATCH])
+        for entity in session.query(f'{select} where {attribute} in ({chunk})'):
+            yield entity
+
+
+def _task_status_ids(session, project, type_id):
+    """IDs of the statuses the project schema's task workflow allows for a task type, or None if unknown."""
+    if project is None:
+        return None
+    try:
+        return {status['id'] for status in project['project_schema'].get_statuses('Task', type_id)}
+    except Exception as e:
+        logger.warning(f"Could not read the task workflow of project {project['id']}: {e}")
+        return None
+
+
+def _task_plan(session, project_id, object_type):
+    """Resolves the template tasks of object_type in a project to (spec, type, status, priority)."""
+    plan = []
+    project = session.query(f'select project_schema from Project where id is "{project_id}"').first()
+    for spec in TASK_TEMPLATES.tasks_for(session, project_id, object_type):
+        task_type = REFERENCE_DATA.type(session, spec.type)
+        if not task_type:
+            logger.warning(f"Could not find a Task Type named '{spec.type}'. Skipping creation of task '{spec.name}'.")
+            continue
+
+        status = REFERENCE_DATA.status(session, spec.status)
+        priority = REFERENCE_DATA.priority(session, spec.priority)
+        if not status:
+            logger.warning(f"Could not find Task Status '{spec.status}'. Tasks will be created with the default status.")
+        else:
+            allowed = _task_status_ids(session, project, task_type['id'])
+            if allowed is not None and status['id'] not in allowed:
+                logger.warning(
+                    f"Status '{spec.status}' is not in the task workflow of the project for type '{spec.type}'. "
+                    f"Tasks will be created with the default status."
+                )
+                status = None
+        if not priority:
+            logger.warning(f"Could not find Priority '{spec.priority}'. Tasks will be created with the default priority.")
+        plan.append((spec, task_type, status, priority))
+    return plan
 
-            if not shot_object:
-                logger.error(f"Failed to fetch details for shot {shot_id} after multiple attempts. Aborting for this entity.")
+
+def create_tasks_for_entities(session, refs):
+    """
+    Creates the template tasks for a batch of new entities, given as
+    (entity type, ID) pairs.
+    Fetches the entities with one query per entity type and their existing
+    tasks with one query, and commits all missing tasks in a single transaction.
+    This version is idempotent.
+    Returns the pairs that are not visible yet, for the caller to retry.
+    """
+    refs = list(dict.fromkeys(refs))
+    logger.info(f"--- Fetching details for {len(refs)} new entities... ---")
+
+    ids_by_type = collections.defaultdict(list)
+    for entity_type, entity_id in refs:
+        ids_by_type[entity_type].append(entity_id)
+
+    entities = {}
+    for entity_type, entity_ids in ids_by_type.items():
+        for entity in _query_in(session, f'select name, project_id from {entity_type}', 'id', entity_ids):
+            entities[(entity_type, entity['id'])] = entity
+    # Not visible yet, e.g. because of database commit delays
+    missing = [ref for ref in refs if ref not in entities]
+    if not entities:
+        return missing
+
+    # Idempotency check: existing tasks of every entity in one query
+    existing_task_names = collections.defaultdict(set)
+    parent_ids = [entity_id for _entity_type, entity_id in entities]
+    for task in _query_in(session, 'select name, parent_id from Task', 'parent_id', parent_ids):
+        existing_task_names[task['parent_id']].add(task['name'])
+
+    # Template tasks of each project and object type, resolved to reference data once per batch
+    plans = {}
+    for (entity_type, _entity_id), entity in entities.items():
+        key = (entity['project_id'], TEMPLATED_ENTITY_TYPES[entity_type])
+        if key not in plans:
+            plans[key] = _task_plan(session, *key)
+
+    def create_tasks(entity_type, entity):
+        created = 0
+        for spec, task_type, status, priority in plans[(entity['project_id'], TEMPLATED_ENTITY_TYPES[entity_type])]:
+            if spec.name in existing_task_names[entity['id']]:
+                logger.info(f"Task '{spec.name}' already exists on {entity_type} '{entity['name']}'. Skipping.")
                 continue
 
+            task_data = {
+                'name': spec.name,
+                'parent_id': entity['id'],
+                'project_id': entity['project_id'],
+                'type_id': task_type['id']
+            }
+            if priority:
+                task_data['priority_id'] = priority['id']
+            if status:
+                task_data['status_id'] = status['id']
+            if spec.bid is not None:
+                task_data['bid'] = spec.bid * SECONDS_PER_HOUR
+            session.create('Task', task_data)
+            created += 1
+        return created
+
+    batch = [(ref[0], entities[ref]) for ref in refs if ref in entities]
+    try:
+        tasks_created_count = sum(create_tasks(entity_type, entity) for entity_type, entity in batch)
+
+        # Commit all prepared tasks in a single transaction.
+        if tasks_created_count > 0:
+            session.commit()
+            logger.info(f"SUCCESS! Committed {tasks_created_count} new tasks for {len(batch)} entities.")
+        else:
+            logger.info("No new tasks were created (they may have all existed already).")
+
+    except Exception as e:
+        # Rollback any changes in the batch if an error occurs
+        session.rollback()
+        if len(batch) == 1:
+            logger.exception(f"CRITICAL: An error occurred while processing {batch[0][0]} ID {batch[0][1]['id']}. Transaction rolled back. Error: {e}")
+            return missing
+        # Retry entity by entity so one bad entity does not cost the whole batch its tasks.
+        logger.warning(f"Batch of {len(batch)} entities failed ({e}). Retrying one by one.")
+        for entity_type, entity in batch:
             try:
-                project = shot_object['project']
-                logger.info(f"Found parent project: '{project['full_name']}'")
-                
-                # --- Define your task template here ---
-                task_names = ['Animation', 'Compositing']
-                
-
-                status = session.query('Status where name is "Not Started"').first()
-                priority = session.query('Priority where name is "None"').first()
-
-                if not status or status.get('entity_type') != 'Task':
-                    logger.warning("Could not find a valid Task Status 'Not Started'. Tasks will be created with the default status.")
-                    status = None
-                if not priority:
-                    logger.warning("Could not find Priority 'None'. Tasks will be created with the default priority.")
-
-                logger.info(f"--- Starting Task Creation for Shot: '{shot_object['name']}' (ID: {shot_id}) ---")
-
-                tasks_created_count = 0
-                for task_name in task_names:
-                    # Idempotency check
-                    existing_task = session.query(
-                        f'Task where name is "{task_name}" and parent.id is "{shot_id}"'
-                    ).first()
-                    if existing_task:
-                        logger.info(f"Task '{task_name}' already exists. Skipping.")
-                        continue
-
-                    task_type = session.query(f'Type where name is "{task_name}"').first()
-                    if not task_type:
-                        logger.warning(f"Could not find a Task Type named '{task_name}'. Skipping creation of this task.")
-                        continue
-
-                    logger.info(f"Preparing to create Task '{task_name}' with Type '{task_type['name']}'...")
-                    task_data = {
-                        'name': task_name,
-                        'parent': shot_object,
-                        'type': task_type
-                    }
-                    if priority:
-                        task_data['priority'] = priority
-                    if status:
-                        task_data['status'] = status
-                    session.create('Task', task_data)
-                    tasks_created_count += 1
-
-                # Commit all prepared tasks in a single transaction outside the loop.
-                if tasks_created_count > 0:
+                if create_tasks(entity_type, entity):
                     session.commit()
-                    logger.info(f"SUCCESS! Committed {tasks_created_count} new tasks for shot '{shot_object['name']}'.")
-                else:
-                    logger.info("No new tasks were created (they may have all existed already).")
+                    logger.info(f"SUCCESS! Committed new tasks for {entity_type} '{entity['name']}'.")
+            except Exception as entity_error:
+                session.rollback()
+                logger.exception(f"CRITICAL: An error occurred while processing {entity_type} ID {entity['id']}. Transaction rolled back. Error: {entity_error}")
+
+    logger.info("--- Finished Task Creation ---")
+    return missing
 
-                logger.info("--- Finished Task Creation ---")
 
-            except Exception as e:
-                # Rollback any changes in the batch if an error occurs
-                session.rollback()
-                logger.exception(f"CRITICAL: An error occurred while processing shot ID {shot_id}. Transaction rolled back. Error: {e}")
 
+def catch_up(since):
+    """Creates the template tasks of entities added while the event hub was disconnected."""
+    # A session of its own, as the listener's session belongs to the batcher thread.
+    session = ftrack_api.Session(auto_connect_event_hub=False)
+    instrument(session, action_name(TEMPLATE_BATCHER.session))
+    try:
+        with measure(session, 'catch_up'):
+            entities = [
+                catch_up_entity(entity_type, entity_id, project_id)
+                for entity_type in TEMPLATED_ENTITY_TYPES
+                for entity_id, project_id in created_since(session, entity_type, since)
+            ]
+    finally:
+        session.close()
+    logger.info(f"Catch-up found {len(entities)} entities created during the outage.")
+    if entities:
+        # Only queues them; the idempotency check skips entities that already have their tasks.
+        create_tasks_for_new_shot(TEMPLATE_BATCHER.session, {'data': {'entities': entities}})
 
 
 def register_event_listener(session):
@@ -122,13 +354,18 @@ def register_event_listener(session):
     
     callback_with_session = functools.partial(create_tasks_for_new_shot, session)
     
-    session.event_hub.subscribe(
+    subscribe(
+        session,
         'topic=ftrack.update', 
-        callback_with_session
+        callback_with_session,
+        entity_types=HANDLED_ENTITY_TYPES
     )
+    REFERENCE_DATA.warm(session)
+    TEMPLATE_BATCHER.start(session)
+    EVENT_BUFFER.start()
     
     logger.info("Event listener registered. Waiting for new Shots via ftrack.update...")
-    session.event_hub.wait()
+    run_event_loop(session, "Shot Creation", catch_up=catch_up)
 
 
 
@@ -136,8 +373,15 @@ def register(session):
     """Register the shot creation automation."""
     logger.info("Registering Shot Creation Automation...")
     callback_with_session = functools.partial(create_tasks_for_new_shot, session)
-    session.event_hub.subscribe(
+    subscribe(
+        session,
         'topic=ftrack.update',
-        callback_with_session
+        callback_with_session,
+        entity_types=HANDLED_ENTITY_TYPES
     )
+    # Load statuses, priorities and types before the first shot arrives
+    REFERENCE_DATA.warm(session)
+    # From here on only the batcher thread uses the session
+    TEMPLATE_BATCHER.start(session)
+    EVENT_BUFFER.start()
     logger.info("Shot Creation Automation registered.")
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Supervisor Module
+Keeps the listener processes of the action server alive. A listener that
+exits is restarted after an exponential backoff; a listener that crashes
+RESTART_LIMIT times within RESTART_WINDOW seconds is considered crash
+looping and is left down. Restart counts are logged with every restart.
+Listener processes send their metrics to the supervisor over a queue.
+"""
+
+import collections
+import logging
+import os
+import signal
+import time
+from multiprocessing import Process
+
+from actions.metrics import start_reporter
+
+logger = logging.getLogger(__name__)
+
+# First restart delay in seconds; doubles with every crash inside the window.
+RESTART_BASE_SECONDS = float(os.getenv('FTRACK_RESTART_BASE_SECONDS', '5'))
+RESTART_MAX_SECONDS = float(os.getenv('FTRACK_RESTART_MAX_SECONDS', '300'))
+
+# Crashes within RESTART_WINDOW seconds after which a listener is given up.
+RESTART_LIMIT = int(os.getenv('FTRACK_RESTART_LIMIT', '5'))
+RESTART_WINDOW = float(os.getenv('FTRACK_RESTART_WINDOW', '600'))
+
+# Seconds between two checks of the listener processes.
+POLL_SECONDS = 1.0
+
+
+def _run_child(target, args, name, metrics_queue):
+    """Entry point of a listener process."""
+    # Restarted children are forked after the supervisor installed its shutdown handlers.
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if metrics_queue is not None:
+        start_reporter(metrics_queue, name)
+    target(*args)
+
+
+class Listener:
+    """One supervised listener process and its crash history."""
+
+    def __init__(self, name, target, args=()):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.restarts = 0
+        self.crashes = collections.deque()
+        self.restart_at = None
+        self.given_up = False
+
+    def start(self, metrics_queue=None):
+        self.process = Process(
+            target=_run_child, args=(self.target, self.args, self.name, metrics_queue), name=self.name
+        )
+        self.process.start()
+        self.restart_at = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    """Starts listeners and restarts the ones that exit, with backoff and a crash loop limit."""
+
+    def __init__(self, listeners, base_seconds=RESTART_BASE_SECONDS, max_seconds=RESTART_MAX_SECONDS,
+                 limit=RESTART_LIMIT, window=RESTART_WINDOW, metrics_queue=None):
+        self.listeners = listeners
+        self.metrics_queue = metrics_queue
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.limit = limit
+        self.window = window
+        self._stopping = False
+        self.logger = logging.getLogger(
+            __name__ + '.' + self.__class__.__name__
+        )
+
+    def start(self):
+        for listener in self.listeners:
+            listener.start(self.metrics_queue)
+        self.logger.info(f"{len(self.listeners)} action processes have started.")
+
+    def run(self):
+        """Supervises the listeners until stop() is called or all of them are given up."""
+        while not self._stopping:
+            if all(listener.given_up for listener in self.listeners):
+                self.logger.critical("Every listener has been given up. Stopping the supervisor.")
+                return
+            for listener in self.listeners:
+                self._check(listener)
+            time.sleep(POLL_SECONDS)
+
+    def _check(self, listener):
+        if listener.given_up or listener.alive:
+            return
+        now = time.monotonic()
+
+        if listener.restart_at is None:
+            # Just exited: record the crash and schedule the restart.
+            exitcode = listener.process.exitcode if listener.process else None
+            listener.crashes.append(now)
+            while listener.crashes and now - listener.crashes[0] > self.window:
+                listener.crashes.popleft()
+
+            if len(listener.crashes) >= self.limit:
+                listener.given_up = True
+                self.logger.critical(
+                    f"Listener '{listener.name}' crashed {len(listener.crashes)} times within "
+                    f"{self.window:g} seconds (exit code {exitcode}). Not restarting it again; "
+                    f"it was restarted {listener.restarts} times in total."
+                )
+                return
+
+            delay = min(self.base_seconds * (2 ** (len(listener.crashes) - 1)), self.max_seconds)
+            listener.restart_at = now + delay
+            self.logger.error(
+                f"Listener '{listener.name}' exited with code {exitcode}. Restarting in {delay:g} seconds."
+            )
+            return
+
+        if now >= listener.restart_at:
+            listener.restarts += 1
+            listener.start(self.metrics_queue)
+            self.logger.warning(f"Listener '{listener.name}' restarted ({listener.restarts} restarts so far).")
+
+    def restart_counts(self):
+        return {listener.name: listener.restarts for listener in self.listeners}
+
+    def stop(self):
+        self._stopping = True
+        for listener in self.listeners:
+            if listener.alive:
+                listener.process.terminate()
+        for listener in self.listeners:
+            if listener.process:
+                listener.process.join()
@@ -0,0 +1,173 @@
+"""
+Task Templates Module
+Registry of the default tasks created under new entities. A template maps an
+object type (e.g. Shot) to a list of tasks with type, status, priority and an
+optional bid. The template of a project is, in order of precedence:
+  1. the project's TEMPLATE_ATTRIBUTE custom attribute: a template name or an inline template,
+  2. the 'projects' entry of its name, then the 'schemas' entry of its schema in TEMPLATE_FILE,
+  3. the 'default' template.
+TEMPLATE_FILE is re-read when it changes, so templates can be edited without a
+redeploy. Templates are compiled once and the selection is cached per project,
+so picking the tasks of a new entity is a dictionary lookup.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FILE = os.getenv(
+    'FTRACK_TASK_TEMPLATES',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'task_templates.yaml')
+)
+
+# Project custom attribute that selects or holds the template of a project.
+TEMPLATE_ATTRIBUTE = os.getenv('FTRACK_TASK_TEMPLATE_ATTRIBUTE', 'task_template')
+
+# Seconds the template selected for a project is cached.
+TEMPLATE_CACHE_TTL = float(os.getenv('FTRACK_TASK_TEMPLATE_TTL', '300'))
+
+# Used when TEMPLATE_FILE is missing or unreadable.
+BUILTIN_TEMPLATES = {
+    'default': {
+        'Shot': ['Animation', 'Compositing'],
+    },
+}
+
+
+class TaskSpec:
+    """One task of a template."""
+
+    __slots__ = ('name', 'type', 'status', 'priority', 'bid')
+
+    def __init__(self, name, type=None, status='Not Started', priority='None', bid=None):
+        self.name = name
+        # Task type name; defaults to the task name.
+        self.type = type or name
+        self.status = status
+        self.priority = priority
+        # Bid in hours, or None.
+        self.bid = float(bid) if bid is not None else None
+
+    @classmethod
+    def from_config(cls, entry):
+        """Builds a spec from a task name or a mapping of the TaskSpec fields."""
+        if isinstance(entry, str):
+            return cls(entry)
+        if isinstance(entry, dict) and entry.get('name'):
+            unknown = set(entry) - set(cls.__slots__)
+            if unknown:
+                raise ValueError(f"Unknown task template fields: {', '.join(sorted(unknown))}")
+            return cls(**entry)
+        raise ValueError(f"Invalid task template entry: {entry!r}")
+
+
+def compile_template(config):
+    """Compiles {object type: [task, ...]} into {object type: (TaskSpec, ...)}."""
+    if not isinstance(config, dict):
+        raise ValueError(f"A task template must map object types to task lists, got {type(config).__name__}.")
+    return {
+        object_type: tuple(TaskSpec.from_config(entry) for entry in (tasks or []))
+        for object_type, tasks in config.items()
+    }
+
+
+class TemplateRegistry:
+    """Compiled task templates and the template selected for each project."""
+
+    def __init__(self, path=TEMPLATE_FILE, ttl=TEMPLATE_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._templates = {name: compile_template(config) for name, config in BUILTIN_TEMPLATES.items()}
+        self._projects = {}
+        self._schemas = {}
+        self._file_mtime = None
+        # project_id -> (loaded_at, compiled template)
+        self._by_project = {}
+        self._lock = threading.Lock()
+
+    def _reload_file(self):
+        """Re-reads TEMPLATE_FILE if it changed; keeps the previous templates if it is broken."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._file_mtime:
+            return
+        self._file_mtime = mtime
+        if mtime is None:
+            logger.info(f"No task template file at {self.path}; using the built-in default.")
+            return
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                config = yaml.safe_load(f) or {}
+            templates = {
+                name: compile_template(template)
+                for name, template in (config.get('templates') or {}).items()
+            }
+        except (OSError, yaml.YAMLError, ValueError, TypeError) as e:
+            logger.error(f"Could not load task templates from {self.path}: {e}. Keeping the previous templates.")
+            return
+
+        templates.setdefault('default', self._templates['default'])
+        self._templates = templates
+        self._projects = dict(config.get('projects') or {})
+        self._schemas = dict(config.get('schemas') or {})
+        self._by_project = {}
+        logger.info(f"Loaded {len(templates)} task templates from {self.path}.")
+
+    def for_project(self, session, project_id):
+        """Returns the compiled template of a project."""
+        with self._lock:
+            self._reload_file()
+            cached = self._by_project.get(project_id)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+
+        project = session.query(
+            'select name, project_schema.name, custom_attributes '
+            f'from Project where id is "{project_id}"'
+        ).first()
+        template = self._select(project) if project else self._templates['default']
+
+        with self._lock:
+            self._by_project[project_id] = (time.monotonic(), template)
+        return template
+
+    def tasks_for(self, session, project_id, object_type):
+        """Returns the TaskSpecs for a new entity of object_type in a project."""
+        return self.for_project(session, project_id).get(object_type, ())
+
+    def _select(self, project):
+        value = project['custom_attributes'].get(TEMPLATE_ATTRIBUTE)
+        if value:
+            if value in self._templates:
+                return self._templates[value]
+            try:
+                return compile_template(yaml.safe_load(value))
+            except (yaml.YAMLError, ValueError, TypeError) as e:
+                logger.warning(
+                    f"Ignoring invalid '{TEMPLATE_ATTRIBUTE}' on project '{project['name']}': {e}"
+                )
+
+        name = self._projects.get(project['name']) or self._schemas.get(project['project_schema']['name'])
+        if name and name not in self._templates:
+            logger.warning(f"Unknown task template '{name}' for project '{project['name']}'; using default.")
+        return self._templates.get(name) or self._templates['default']
+
+    def invalidate(self, project_id=None):
+        """Forgets the template of one project, or of all projects."""
+        with self._lock:
+            if project_id is None:
+                self._by_project = {}
+            else:
+                self._by_project.pop(project_id, None)
+
+
+# Shared by every automation in the process.
+TASK_TEMPLATES = TemplateRegistry()
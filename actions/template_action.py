@@ -4,8 +4,22 @@ import sys
 import json
 import datetime
 import os
+import time
 from dotenv import load_dotenv
-from actions.copy_lock import set_copy_in_progress
+from actions.copy_lock import CopyLease
+from actions.clone_engine import (
+    DEFAULT_BATCH_SIZE, DEFAULT_WORKERS, CloneEngine, CopyCancelled, prefetch_hierarchy
+)
+from actions.clone_schema import SchemaLookup
+from actions.copy_assets import AssetStage
+from actions.copy_filter import CopyFilter
+from actions.copy_journal import CopyJournal
+from actions.copy_planner import plan_copy
+from actions.custom_attributes import AttributeConfigurations
+from actions.event_router import subscribe
+from actions.instrumentation import action_name, instrument, measure
+from actions.job_executor import JobExecutor
+from actions.job_progress import JobProgress
 
 import logging
 logger = logging.getLogger(__name__)
@@ -13,6 +27,23 @@ logger = logging.getLogger(__name__)
 # Suppress ftrack_api internal error logging for expected validation errors
 logging.getLogger('ftrack_api.session').setLevel(logging.CRITICAL)
 
+# Seconds the source project picker options are cached for.
+PROJECT_CACHE_TTL = float(os.getenv('FTRACK_PROJECT_CACHE_TTL', '300'))
+
+# Leave archived (hidden) projects out of the copy sources; they are offered by default.
+EXCLUDE_ARCHIVED_PROJECTS = os.getenv('FTRACK_COPY_EXCLUDE_ARCHIVED', '0') == '1'
+
+# Entity types of ftrack.update events that invalidate the project picker.
+PROJECT_ENTITY_TYPES = ('show', 'Project')
+
+
+def _form_workers(form_data):
+    """The worker count entered in the form, or DEFAULT_WORKERS if it is empty or not a number."""
+    try:
+        return int(float(form_data.get('workers')))
+    except (TypeError, ValueError, OverflowError):
+        return DEFAULT_WORKERS
+
 class CreateProjectFromCopyAction:
     """Action to create a new project by copying an existing one."""
 
@@ -20,12 +51,20 @@ class CreateProjectFromCopyAction:
     identifier = 'com.ftrack.create-from-copy.action'
     description = 'Creates a new project by copying an existing project structure.'
 
+    cancel_label = 'Cancel Project Copy'
+    cancel_identifier = 'com.ftrack.create-from-copy.cancel'
+
     def __init__(self, session):
         """Initialise action with ftrack session."""
         self.session = session
         self.logger = logging.getLogger(
             __name__ + '.' + self.__class__.__name__
         )
+        # Copies run in the background so the event hub thread stays responsive.
+        self.executor = JobExecutor(name='project-copy')
+        # Sorted form options of the source project picker, rebuilt when stale.
+        self._project_options = None
+        self._project_options_loaded_at = 0.0
 
     def register(self):
         """Register the action with the ftrack event hub."""
@@ -37,7 +76,75 @@ class CreateProjectFromCopyAction:
             f'topic=ftrack.action.launch and data.actionIdentifier={self.identifier}',
             self._launch
         )
+        self.session.event_hub.subscribe(
+            f'topic=ftrack.action.launch and data.actionIdentifier={self.cancel_identifier}',
+            self._launch_cancel
+        )
+        # Only project changes reach the handler, not every update of the hierarchy.
+        subscribe(
+            self.session,
+            'topic=ftrack.update',
+            self._on_update,
+            entity_types=PROJECT_ENTITY_TYPES
+        )
         self.logger.info(f'"{self.label}" action registered.')
+        self._fail_interrupted_jobs()
+        self._get_project_options()
+
+    def _on_update(self, event):
+        """Drops the cached project picker when any project changes."""
+        # Subscribed for PROJECT_ENTITY_TYPES only, so every event is a project change.
+        self.logger.debug("Project changed; invalidating project picker cache.")
+        self._project_options = None
+
+    def _get_project_options(self):
+        """Returns the sorted source project options, using the TTL cache."""
+        options = self._project_options
+        if options is not None and time.monotonic() - self._project_options_loaded_at < PROJECT_CACHE_TTL:
+            return options
+
+        query = 'select id, full_name from Project'
+        if EXCLUDE_ARCHIVED_PROJECTS:
+            query += ' where status is "active"'
+        self.logger.info("Querying for projects to populate form dropdown.")
+        all_projects = list(self.session.query(query))
+        self.logger.info(f"Found {len(all_projects)} projects.")
+
+        options = [
+            {'label': p['full_name'], 'value': p['id']}
+            for p in sorted(all_projects, key=lambda x: x['full_name'])
+        ]
+        self._project_options = options
+        self._project_options_loaded_at = time.monotonic()
+        return options
+
+    def _fail_interrupted_jobs(self):
+        """Marks jobs of copies interrupted by a restart as failed.
+
+        Their journals are kept so the copy resumes when it is launched again.
+        Jobs that were still queued, prefetching or dry running have no journal;
+        the executor's job list of the previous process names them.
+        """
+        for journal in CopyJournal.pending():
+            for job_id in journal.job_ids:
+                self._close_job(
+                    self.session,
+                    job_id,
+                    f"Interrupted before '{journal.new_project_name}' finished copying. "
+                    f"Run the copy again with the same name to resume."
+                )
+        for job_id in self.executor.interrupted:
+            self._close_job(self.session, job_id, "Interrupted by a restart. Run the copy again.")
+        self.session.commit()
+        self.executor.forget_interrupted()
+
+    def _close_job(self, session, job_id, description):
+        """Fails a job that is still marked as running."""
+        job = session.get('Job', job_id)
+        if job and job['status'] in ('queued', 'running'):
+            job['status'] = 'failed'
+            job['data'] = json.dumps({'description': description})
+            self.logger.info(f"Marked job {job_id} as failed.")
 
     def _discover(self, event):
         """Only show this action on the project overview/actions page."""
@@ -47,45 +154,71 @@ class CreateProjectFromCopyAction:
         if selection and selection[0].get('entityType') != 'show':
             return
         self.logger.info("Discover event received, action is available.")
-        return {
-            'items': [{
-                'label': self.label,
-                'actionIdentifier': self.identifier,
-                'icon': 'https://api.iconify.design/feather/copy.svg?color=%23ffffff'
-
-            }]
-        }
+        items = [{
+            'label': self.label,
+            'actionIdentifier': self.identifier,
+            'icon': 'https://api.iconify.design/feather/copy.svg?color=%23ffffff'
+
+        }]
+        if self.executor.active_jobs():
+            items.append({
+                'label': self.cancel_label,
+                'actionIdentifier': self.cancel_identifier,
+                'icon': 'https://api.iconify.design/feather/x-circle.svg?color=%23ffffff'
+            })
+        return {'items': items}
 
     def _launch(self, event):
         """Handles both displaying the form and processing the submission."""
         self.logger.info("Launch event received.")
         if 'values' in event['data']:
             self.logger.info("Processing form submission.")
-            self._process_form(event)
-            return {'success': True, 'message': 'Project copy job started!'}
+            return self._process_form(event)
 
         self.logger.info("Building form for user.")
         return self._build_form(event)
 
+    def _launch_cancel(self, event):
+        """Lists running copies and cancels the selected one."""
+        values = event['data'].get('values')
+        if values:
+            if self.executor.cancel(values['job_id']):
+                return {'success': True, 'message': 'Cancellation requested.'}
+            return {'success': False, 'message': 'That copy already finished.'}
+
+        jobs = self.executor.active_jobs()
+        if not jobs:
+            return {'success': False, 'message': 'No project copy is running.'}
+        job_options = [
+            {'label': f"{label} ({'running' if started else 'queued'})", 'value': job_id}
+            for job_id, label, started in jobs
+        ]
+        return {
+            'type': 'form',
+            'title': self.cancel_label,
+            'submit_button_label': 'Cancel Copy',
+            'items': [
+                {
+                    'label': 'Copy',
+                    'type': 'enumerator',
+                    'name': 'job_id',
+                    'data': job_options,
+                    'value': job_options[0]['value']
+                }
+            ],
+        }
+
     def _build_form(self, event):
-        """Queries for projects and returns the UI form definition."""
-        self.logger.info("Querying for all projects to populate form dropdown.")
-        
-        all_projects = list(self.session.query('select id, full_name from Project'))
-        self.logger.info(f"Found {len(all_projects)} projects.")
+        """Returns the UI form definition using the cached project list."""
+        project_options = self._get_project_options()
 
-        if not all_projects:
+        if not project_options:
             self.logger.warning("No projects found in ftrack instance.")
             return {
                 'success': False,
                 'message': 'No projects found to copy from.'
             }
 
-        project_options = [
-            {'label': p['full_name'], 'value': p['id']}
-            for p in sorted(all_projects, key=lambda x: x['full_name'])
-        ]
-
         return {
             'type': 'form',
             'title': 'Create Project from Copy',
@@ -112,13 +245,62 @@ class CreateProjectFromCopyAction:
                     'type': 'date',
                     'name': 'new_start_date',
                     'value': datetime.date.today().isoformat()
+                },
+                {
+                    'label': 'Parallel Workers',
+                    'type': 'number',
+                    'name': 'workers',
+                    'value': DEFAULT_WORKERS
+                },
+                {
+                    'label': 'Also copy Assets, Versions (no components), Lists and Review Sessions',
+                    'type': 'boolean',
+                    'name': 'copy_assets',
+                    'value': False
+                },
+                {'type': 'label', 'value': '### Optional: copy only part of the project'},
+                {
+                    'label': 'Subtree Path (e.g. sq010 or sq010/sh020; empty = whole project)',
+                    'type': 'text',
+                    'name': 'subtree_path',
+                    'value': ''
+                },
+                {
+                    'label': 'Max Depth (0 = unlimited)',
+                    'type': 'number',
+                    'name': 'max_depth',
+                    'value': 0
+                },
+                {
+                    'label': 'Only Entity Types (comma separated, empty = all)',
+                    'type': 'text',
+                    'name': 'include_types',
+                    'value': ''
+                },
+                {
+                    'label': 'Skip Entity Types (comma separated, e.g. Task, Milestone)',
+                    'type': 'text',
+                    'name': 'exclude_types',
+                    'value': ''
+                },
+                {
+                    'label': 'Name Filter (glob, e.g. sh01*)',
+                    'type': 'text',
+                    'name': 'name_glob',
+                    'value': ''
+                },
+                {
+                    'label': 'Dry Run (only estimate the copy, nothing is created)',
+                    'type': 'boolean',
+                    'name': 'dry_run',
+                    'value': False
                 }
             ],
         }
 
 
     def _process_form(self, event):
-        """Process form submission and start the background cloning job."""
+        """Validate the form submission and queue the background cloning job."""
         values = event['data']['values']
         self.logger.info(f"Form values received: {values}")
 
@@ -127,42 +309,135 @@ class CreateProjectFromCopyAction:
         if not values.get('new_project_name'):
             self.logger.warning("Form submitted with no project name.")
             return {'success': False, 'message': 'Please enter a project name.'}
-        
+
+        try:
+            CopyFilter.from_form(values)
+        except ValueError as e:
+            self.logger.warning(f"Form submitted with an invalid filter: {e}")
+            return {'success': False, 'message': str(e)}
+
+        dry_run = values.get('dry_run') in (True, 'true', 'True')
         job = self.session.create('Job', {
             'user_id': user_id,
-            'status': 'running',
-            'data': json.dumps({'description': f"Starting copy of project '{values['new_project_name']}'."})
+            'status': 'queued',
+            'data': json.dumps({'description': f"Queued copy of project '{values['new_project_name']}'."})
         })
         self.session.commit()
         self.logger.info(f"Created job {job['id']} to track progress.")
-        
+
+        label = f"{'Dry run' if dry_run else 'Copy'} of '{values['new_project_name']}'"
+        if not self.executor.submit(job['id'], label, self._run_job, values, job['id'], dry_run):
+            job['status'] = 'failed'
+            job['data'] = json.dumps({'description': "ERROR: Too many project copies are already queued."})
+            self.session.commit()
+            return {'success': False, 'message': 'Too many project copies are queued. Try again later.'}
+
+        if dry_run:
+            return {'success': True, 'message': 'Dry run started! The estimate will appear in the Jobs panel.'}
+        return {'success': True, 'message': 'Project copy job started!'}
+
+    def _run_job(self, cancel_event, values, job_id, dry_run):
+        """Runs a queued copy or dry run on its own session (executor thread).
+
+        Always leaves the job finished: killed when it was cancelled while
+        queued, failed when its session or the job could not be loaded.
+        """
+        session = None
+        try:
+            session = self._create_worker_session()
+            job = session.get('Job', job_id)
+            if cancel_event.is_set():
+                self.logger.info(f"Job {job_id} was cancelled before it started.")
+                job['data'] = json.dumps({'description': "Cancelled before it started."})
+                job['status'] = 'killed'
+                session.commit()
+                return
+            job['status'] = 'running'
+            if dry_run:
+                with measure(session, f'{self.__class__.__name__}._dry_run'):
+                    self._dry_run(session, values, job)
+            else:
+                with measure(session, f'{self.__class__.__name__}._run_copy'):
+                    self._run_copy(session, values, job, cancel_event)
+        except Exception as e:
+            # _dry_run and _run_copy record their own errors; this is the setup failing.
+            self.logger.error(f"Job {job_id} could not be run: {e}", exc_info=True)
+            self._fail_job(job_id, f"ERROR: Could not start the copy. Reason: {e}")
+        finally:
+            if session is not None:
+                session.close()
+
+    def _fail_job(self, job_id, description):
+        """Fails a job on a fresh session; the one of the job may be unusable."""
+        try:
+            session = self._create_worker_session()
+            try:
+                self._close_job(session, job_id, description)
+                session.commit()
+            finally:
+                session.close()
+        except Exception as e:
+            self.logger.error(f"Could not mark job {job_id} as failed: {e}")
+
+    def _run_copy(self, session, values, job, cancel_event):
+        """Runs one project copy and records its outcome on the job."""
         try:
-            # Set the copy lock to prevent other actions from running
-            set_copy_in_progress(True)
-            self.logger.info("Copy lock ENABLED - other actions will be paused.")
-            
-            self._clone_project(values, job)
-            job['data'] = json.dumps({'description': f"Successfully copied project '{values['new_project_name']}'."})
+            counters = self._clone_project(session, values, job, cancel_event)
+            job['data'] = json.dumps({
+                'description': f"Successfully copied project '{values['new_project_name']}'.",
+                'created': counters.created,
+                'fallbacks': counters.fallbacks,
+                'skipped': counters.skipped,
+                'resumed': counters.resumed,
+                'percent': 100,
+            })
             job['status'] = 'done'
             self.logger.info(f"Job {job['id']} completed successfully.")
+        except CopyCancelled:
+            self.logger.warning(f"Job {job['id']} was cancelled.")
+            job['data'] = json.dumps({
+                'description': f"Cancelled. Run the copy again with the same name to resume."
+            })
+            job['status'] = 'killed'
         except Exception as e:
             self.logger.error(f"Job {job['id']} failed: {e}", exc_info=True)
             job['data'] = json.dumps({'description': f"ERROR: Could not copy project. Reason: {e}"})
             job['status'] = 'failed'
         finally:
-            # Always release the copy lock when done
-            set_copy_in_progress(False)
-            self.logger.info("Copy lock DISABLED - other actions resumed.")
-            self.session.commit()
+            session.commit()
 
-    def _clone_project(self, form_data, job):
+    def _dry_run(self, session, form_data, job):
+        """Prefetches the source project and reports the copy plan without creating anything."""
+        try:
+            source_project = session.get('Project', form_data['source_project_id'])
+            copy_filter = CopyFilter.from_form(form_data)
+            source_index = copy_filter.apply(prefetch_hierarchy(session, source_project['id']))
+            schema = SchemaLookup(session, source_project['project_schema_id'])
+            plan = plan_copy(
+                source_index, schema, DEFAULT_BATCH_SIZE,
+                workers=_form_workers(form_data)
+            )
+            message = (
+                f"Dry run for '{form_data['new_project_name']}' ({copy_filter.describe()}): {plan.summary()}"
+            )
+            self.logger.info(message)
+            job['data'] = json.dumps({'description': message})
+            job['status'] = 'done'
+        except Exception as e:
+            self.logger.error(f"Dry run failed: {e}", exc_info=True)
+            message = f"ERROR: Could not plan the copy. Reason: {e}"
+            job['data'] = json.dumps({'description': message})
+            job['status'] = 'failed'
+        session.commit()
+
+    def _clone_project(self, session, form_data, job, cancel_event=None):
         """The main logic for cloning the project."""
         source_project_id = form_data['source_project_id']
         new_project_full_name = form_data['new_project_name']
         new_start_date = datetime.datetime.strptime(form_data['new_start_date'], '%Y-%m-%d %H:%M:%S')
         self.logger.info(f"Starting clone from source project ID: {source_project_id}")
         
-        source_project = self.session.get('Project', source_project_id)
+        source_project = session.get('Project', source_project_id)
         
         new_end_date = None
         if source_project['start_date'] and source_project['end_date']:
@@ -172,16 +447,88 @@ class CreateProjectFromCopyAction:
         else:
             self.logger.warning("Source project missing start/end dates. New end date will not be set.")
         
-        if self.session.query(f'Project where full_name is "{new_project_full_name}"').first():
-            raise ValueError(f"A project named '{new_project_full_name}' already exists.")
+        journal = CopyJournal(source_project_id, new_project_full_name)
+        new_project = None
+        lease = None
+        if journal.resumable:
+            new_project = session.get('Project', journal.target_project_id)
+            if not new_project:
+                self.logger.warning("Journaled target project no longer exists. Starting a fresh copy.")
+            else:
+                # Taken before the earlier job or the journal is touched: raises while
+                # that copy is still running, e.g. for a duplicate submission.
+                lease = CopyLease(new_project['id'], api_user=session.api_user).acquire()
 
-        job['data'] = json.dumps({'description': f"Creating project '{new_project_full_name}'..."})
-        self.session.commit()
+        try:
+            if not new_project and session.query(f'Project where full_name is "{new_project_full_name}"').first():
+                raise ValueError(f"A project named '{new_project_full_name}' already exists.")
+
+            progress = JobProgress(job, f"Copying '{new_project_full_name}'")
+            progress.stage("Reading source project structure...")
+            copy_filter = CopyFilter.from_form(form_data)
+            source_index = copy_filter.apply(prefetch_hierarchy(session, source_project_id))
+            if copy_filter.active:
+                self.logger.info(f"Copy filter ({copy_filter.describe()}) selected {len(source_index)} entities.")
+            attributes = AttributeConfigurations(session)
+            # The new project uses the source project's schema.
+            schema = SchemaLookup(session, source_project['project_schema_id'])
+
+            if new_project:
+                self.logger.info(
+                    f"Resuming copy into existing project {new_project['id']} "
+                    f"({len(journal.mapping)} entities already copied)."
+                )
+                for job_id in journal.job_ids:
+                    self._close_job(session, job_id, f"Interrupted. Resumed by job {job['id']}.")
+                journal.resume(job['id'])
+            else:
+                progress.stage(f"Creating project ({len(source_index)} entities)...")
+                new_project = self._create_project(
+                    session, source_project, new_project_full_name, new_start_date, new_end_date,
+                    source_index.project_custom_attributes, attributes
+                )
+                # Pause the other actions for the new project only while it is being filled.
+                lease = CopyLease(new_project['id'], api_user=session.api_user).acquire()
+                journal.start(new_project['id'], job['id'])
+
+            workers = _form_workers(form_data)
+            engine = CloneEngine(
+                session, journal=journal, progress=progress, cancel_event=cancel_event,
+                attributes=attributes, schema=schema
+            )
+            engine.clone(
+                source_index,
+                new_project,
+                session_factory=self._create_worker_session,
+                workers=workers
+            )
+
+            if form_data.get('copy_assets') in (True, 'true', 'True'):
+                progress.stage("Copying assets, versions, lists and review sessions...")
+                session.commit()
+                # A session of its own: the stage clears its cache after every batch.
+                asset_session = self._create_worker_session()
+                try:
+                    AssetStage(
+                        asset_session, source_project_id, new_project['id'], engine.id_map,
+                        journal=journal, progress=progress, cancel_event=cancel_event
+                    ).run()
+                finally:
+                    asset_session.close()
+        finally:
+            if lease:
+                lease.release()
+
+        journal.complete()
+        return engine.counters
 
+    def _create_project(self, session, source_project, new_project_full_name, new_start_date, new_end_date,
+                        custom_attributes, attributes):
+        """Creates the target project and copies the project-level custom attributes."""
         new_project_short_name = new_project_full_name.lower().replace(' ', '_')
         self.logger.info(f"Creating new project entity: '{new_project_full_name}' (Short name: {new_project_short_name})")
 
-        new_project = self.session.create('Project', {
+        new_project = session.create('Project', {
             'name': new_project_short_name,
             'full_name': new_project_full_name,
             'project_schema': source_project['project_schema'],
@@ -189,113 +536,24 @@ class CreateProjectFromCopyAction:
             'end_date': new_end_date
         })
 
-        for key, value in source_project['custom_attributes'].items():
-            new_project['custom_attributes'][key] = value
+        attributes.push_values(session, new_project['id'], custom_attributes)
         self.logger.info(f"Copied custom attributes from source project.")
 
-        self.session.commit()
-        self.logger.info(f"New project created with ID: {new_project['id']}. Starting recursive copy.")
-
-        self._clone_recursive(source_project, new_project)
-
-    def _clone_recursive(self, source_parent, target_parent):
-        """Recursively clones all children from a source parent to a target parent."""
-        
-        # 1. SORTING FIX:
-        # Handle cases where 'sort' or 'position' is explicitly None to prevent crashes.
-        source_children = sorted(
-            source_parent['children'], 
-            key=lambda child: (child.get('sort') or child.get('position') or 0)
+        session.commit()
+        self.logger.info(f"New project created with ID: {new_project['id']}. Starting level-order copy.")
+        return new_project
+
+    def _create_worker_session(self):
+        """Creates an independent session for a background job or copy worker."""
+        session = ftrack_api.Session(
+            api_key=os.getenv('FTRACK_API_KEY'),
+            api_user=os.getenv('FTRACK_API_USER'),
+            server_url=os.getenv('FTRACK_SERVER'),
+            auto_connect_event_hub=False
         )
-        
-        self.logger.info(f"Found {len(source_children)} children to copy under '{source_parent['name']}'.")
-        
-        for source_child in source_children:
-            self.logger.info(f"Copying '{source_child['name']}' ({source_child.entity_type}) to '{target_parent['name']}'.")
-            
-            # 2. PREPARE DATA
-            new_child_data = {
-                'name': source_child['name'],
-                'parent': target_parent,
-                'description': source_child.get('description', '')
-            }
-
-            # Attempt to keep the exact same Object Type (e.g., Scene, Sequence)
-            if 'object_type_id' in source_child:
-                new_child_data['object_type_id'] = source_child['object_type_id']
-
-            # Handle Shot Frames
-            if source_child.entity_type == 'Shot':
-                new_child_data['fstart'] = source_child.get('fstart')
-                new_child_data['fend'] = source_child.get('fend')
-
-            # Handle Task Type
-            if source_child.entity_type == 'Task':
-                new_child_data['type'] = source_child.get('type')
-
-            # 3. CREATE ENTITY (With Fallback)
-            new_child = None
-            try:
-                # Try to create the exact same type as the source
-                new_child = self.session.create(source_child.entity_type, new_child_data)
-                self.session.commit()
-            
-            except ftrack_api.exception.ServerError as e:
-                error_str = str(e)
-                
-                # Handle DuplicateEntryError - skip this entity as it already exists
-                if "DuplicateEntryError" in error_str:
-                    self.logger.warning(
-                        f"Skipping '{source_child['name']}' - already exists in target project."
-                    )
-                    self.session.rollback()
-                    continue
-                
-                # Catch Schema Validation Errors (e.g. "Object type 'Scene' cannot be created...")
-                elif "ValidationError" in error_str:
-                    self.logger.warning(
-                        f"Schema Restriction: Could not create '{source_child['name']}' as '{source_child.entity_type}'. "
-                        f"Falling back to generic 'Folder' to preserve structure."
-                    )
-                    
-                    # Rollback to clear the failed entity from the session
-                    self.session.rollback()
-                    
-                    # FALLBACK: Remove specific type ID and retry as a generic Folder
-                    new_child_data.pop('object_type_id', None)
-                    new_child_data.pop('fstart', None) # Folders don't have frames
-                    new_child_data.pop('fend', None)
-
-                    try:
-                        new_child = self.session.create('Folder', new_child_data)
-                        self.session.commit()
-                        self.logger.info(f" -> Success: Created '{source_child['name']}' as a Folder.")
-                    except Exception as e2:
-                        self.logger.error(f" -> Failed even as Folder: {e2}")
-                        self.session.rollback()
-                        continue # Skip this child if even Folder fails
-                else:
-                    # If it's a real server error (e.g. Database down), rollback and raise it.
-                    self.session.rollback()
-                    raise e
-            except Exception as e:
-                self.logger.error(f"Unexpected error copying '{source_child['name']}': {e}")
-                self.session.rollback()
-                continue
-
-            # 4. COPY CUSTOM ATTRIBUTES (Safely)
-            if new_child:
-                for key, value in source_child['custom_attributes'].items():
-                    # Only set the attribute if the new entity allows it (Schema check)
-                    if key in new_child['custom_attributes']:
-                        new_child['custom_attributes'][key] = value
-                
-                # Commit attributes
-                self.session.commit()
-
-                # 5. RECURSION
-                if source_child.entity_type not in ['Task', 'Milestone']:
-                    self._clone_recursive(source_child, new_child)
+        # Its round trips count towards this action in /metrics.
+        instrument(session, action_name(self.session, self.label))
+        return session
 
 def register(session):
     """Register the project copy action."""
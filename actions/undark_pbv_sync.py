@@ -9,10 +9,13 @@ import os
 import threading
 import logging
 import functools
-import time
 from dotenv import load_dotenv
 import ftrack_api
-from actions.copy_lock import is_copy_in_progress
+from actions.copy_lock import is_copy_event, is_entity_locked
+from actions.event_buffer import EventBuffer
+from actions.event_hub_loop import catch_up_entity, created_since, run_event_loop
+from actions.event_router import subscribe
+from actions.instrumentation import instrument, measure
 
 
 # --- Logging Configuration ---
@@ -40,15 +43,21 @@ UNDARK_FTRACK_API_USER = os.getenv("UNDARK_FTRACK_API_USER")
 UNDARK_FTRACK_API_URL = os.getenv("UNDARK_FTRACK_API_URL")
 
 
+# Entity types and actions mirrored between the servers.
+SYNCED_ENTITY_TYPES = ("task", "note", "assetversion")
+# Entity types created on PBV during an event hub outage that are synced afterwards
+CATCH_UP_ENTITY_TYPES = ("Task", "AssetVersion")
+
+
 # --- Helper Functions ---
-def get_ftrack_session(api_key, api_user, api_url):
+def get_ftrack_session(api_key, api_user, api_url, auto_connect_event_hub=True):
     logger.info("Connecting to ftrack server: %s as %s", api_url, api_user)
     try:
         session = ftrack_api.Session(
             api_key=api_key,
             api_user=api_user,
             server_url=api_url,
-            auto_connect_event_hub=True,
+            auto_connect_event_hub=auto_connect_event_hub,
         )
         logger.info("Connected successfully to %s", api_url)
         return session
@@ -117,31 +126,6 @@ def _describe_version_location(version):
         return f"<unknown: {_safe_str(exc)}>"
 
 
-def _event_hub_listener(event_hub, label, retry_delay=30):
-    """Continuously wait on an event hub, reconnecting after transient failures."""
-    while True:
-        try:
-            logger.info("[%s EVENT HUB] Waiting for events...", label)
-            event_hub.wait()
-            logger.info("[%s EVENT HUB] wait() exited; restarting listener.", label)
-        except ftrack_api.exception.EventHubConnectionError as exc:
-            logger.error(
-                "[%s EVENT HUB] Connection error: %s. Retrying in %s seconds.",
-                label,
-                _safe_str(exc),
-                retry_delay,
-            )
-            time.sleep(retry_delay)
-        except Exception as exc:
-            logger.exception(
-                "[%s EVENT HUB] Unexpected error: %s. Retrying in %s seconds.",
-                label,
-                _safe_str(exc),
-                retry_delay,
-            )
-            time.sleep(retry_delay)
-
-
 # --- Task Sync ---
 def handle_task_creation(entity, session_pbv, session_undark):
     task_id = entity.get("entityId")
@@ -602,19 +586,77 @@ def handle_version_creation(entity, session_pbv, session_undark):
         )
 
 
+# --- Buffered Events ---
+# Sessions used by the replay thread; sessions are not shared between threads.
+_replay_sessions = None
+
+
+def _replay_entity(entity):
+    """Syncs an entity that was held back by a project copy."""
+    global _replay_sessions
+    if _replay_sessions is None:
+        _replay_sessions = (
+            get_ftrack_session(PBV_FTRACK_API_KEY, PBV_FTRACK_API_USER, PBV_FTRACK_API_URL,
+                               auto_connect_event_hub=False),
+            get_ftrack_session(UNDARK_FTRACK_API_KEY, UNDARK_FTRACK_API_USER, UNDARK_FTRACK_API_URL,
+                               auto_connect_event_hub=False),
+        )
+        instrument(_replay_sessions[0], "PBV")
+        instrument(_replay_sessions[1], "UNDARK")
+    with measure(_replay_sessions[0], "_replay_entity"):
+        sync_event_handler(*_replay_sessions, {"data": {"entities": [entity]}})
+
+
+EVENT_BUFFER = EventBuffer("undark_pbv_sync", _replay_entity)
+
+
+def catch_up(since):
+    """Syncs tasks and versions created on PBV while its event hub was disconnected.
+
+    Notes are not caught up; they are only synced from their events.
+    """
+    session_pbv = get_ftrack_session(PBV_FTRACK_API_KEY, PBV_FTRACK_API_USER, PBV_FTRACK_API_URL,
+                                     auto_connect_event_hub=False)
+    session_undark = get_ftrack_session(UNDARK_FTRACK_API_KEY, UNDARK_FTRACK_API_USER, UNDARK_FTRACK_API_URL,
+                                        auto_connect_event_hub=False)
+    instrument(session_pbv, "PBV")
+    instrument(session_undark, "UNDARK")
+    try:
+        with measure(session_pbv, "catch_up"):
+            entities = [
+                catch_up_entity(entity_type, entity_id, project_id)
+                for entity_type in CATCH_UP_ENTITY_TYPES
+                for entity_id, project_id in created_since(session_pbv, entity_type, since)
+            ]
+            logger.info("[CATCH-UP] %s entities were created on PBV during the outage.", len(entities))
+            # The handlers skip anything that already exists on UNDARK.
+            sync_event_handler(session_pbv, session_undark, {"data": {"entities": entities}})
+    finally:
+        session_pbv.close()
+        session_undark.close()
+
+
 # --- Event Dispatcher ---
 def sync_event_handler(session_pbv, session_undark, event):
-    # Skip processing if a project copy is in progress
-    if is_copy_in_progress():
-        logger.debug("[EVENT] Skipping: Project copy in progress")
-        return
-    
     logger.debug("[EVENT] Raw event data: %s", event)
     for entity in event["data"].get("entities", []):
         action = _resolve_action(entity)
         etype = _resolve_entity_type(entity)
         logger.debug("[EVENT] Entity=%s Action=%s", etype, action)
 
+        if etype not in SYNCED_ENTITY_TYPES or action != "add":
+            continue
+
+        # Hold back entities of a project that is currently being copied
+        if is_entity_locked(entity):
+            if is_copy_event(event, entity):
+                # Created by the copy itself; replaying it would undo the lock.
+                logger.debug("[EVENT] Skipping %s: Created by the project copy", etype)
+                continue
+            logger.debug("[EVENT] Buffering %s: Project copy in progress", etype)
+            EVENT_BUFFER.capture(entity)
+            continue
+
         if etype == "task" and action == "add":
             handle_task_creation(entity, session_pbv, session_undark)
         elif etype == "note" and action == "add":
@@ -629,19 +671,25 @@ def register(session_pbv):
     session_undark = get_ftrack_session(
         UNDARK_FTRACK_API_KEY, UNDARK_FTRACK_API_USER, UNDARK_FTRACK_API_URL
     )
+    # Handler latency and round trips to both servers; a no-op for sessions already instrumented
+    instrument(session_pbv, "PBV")
+    instrument(session_undark, "UNDARK")
 
     callback = functools.partial(sync_event_handler, session_pbv, session_undark)
     topics = ["ftrack.update", "ftrack.note"]
 
     for topic in topics:
-        session_pbv.event_hub.subscribe(f"topic={topic}", callback)
-        session_undark.event_hub.subscribe(f"topic={topic}", callback)
+        subscribe(session_pbv, f"topic={topic}", callback, entity_types=SYNCED_ENTITY_TYPES)
+        subscribe(session_undark, f"topic={topic}", callback, entity_types=SYNCED_ENTITY_TYPES)
         logger.info("Subscribed to topic: %s", topic)
 
+    # Replays entities held back while their project was being copied
+    EVENT_BUFFER.start()
+
     # Background listener for UNDARK
     thread = threading.Thread(
-        target=_event_hub_listener,
-        args=(session_undark.event_hub, "UNDARK"),
+        target=run_event_loop,
+        args=(session_undark, "UNDARK"),
         daemon=True,
     )
     thread.start()
@@ -654,4 +702,4 @@ if __name__ == "__main__":
     pbv = get_ftrack_session(PBV_FTRACK_API_KEY, PBV_FTRACK_API_USER, PBV_FTRACK_API_URL)
     register(pbv)
     logger.info("Listening for PBV events...")
-    _event_hub_listener(pbv.event_hub, "PBV")
+    run_event_loop(pbv, "PBV", catch_up=catch_up)
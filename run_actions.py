@@ -1,17 +1,24 @@
 import ftrack_api
 import logging
+import multiprocessing
 import os
 import signal
 import sys
-from multiprocessing import Process
 from dotenv import load_dotenv
 
 # Import the register functions from your action files
 from actions.shot_creation_action import register as register_shot_automation
+from actions.shot_creation_action import catch_up as catch_up_shot_automation
 from actions.template_action import register as register_project_copy
 from actions.undark_pbv_sync import register as register_undark_pbv_sync
 from actions.daily_internal import register as register_daily_internal
 from actions.client_review_action import register as register_client_review
+from actions.event_hub_loop import run_event_loop
+from actions.event_router import EventRouter
+from actions.health_server import HealthServer
+from actions.instrumentation import instrument
+from actions.metrics import LISTENER_READY, MetricsCollector
+from actions.supervisor import Listener, Supervisor
 
 # --- Setup ---
 logging.basicConfig(level=logging.INFO)
@@ -25,14 +32,21 @@ REQUIRED_ENVS = [
     'FTRACK_API_KEY',
 ]
 
+# Receive events over one shared event hub connection instead of one per action process.
+SINGLE_HUB = os.getenv('FTRACK_SINGLE_HUB', '0').lower() in ('1', 'true', 'yes')
+
 missing = [e for e in REQUIRED_ENVS if not os.getenv(e)]
 if missing:
     logger.error(f"Missing required environment variables: {', '.join(missing)}. Please set them in .env or the environment.")
     sys.exit(1)
 
 # --- Functions to run each listener ---
-def run_listener(register_function, name):
-    """Initializes a session and runs a listener function."""
+def run_listener(register_function, name, catch_up=None):
+    """Initializes a session and runs a listener function.
+
+    catch_up -- optional callable(since) replaying what was missed while the
+                event hub was disconnected.
+    """
     logger.info(f"Starting listener process: {name}")
     try:
         # Each process must load the .env file to get credentials
@@ -50,46 +64,97 @@ def run_listener(register_function, name):
             server_url=server_url,
             auto_connect_event_hub=True
         )
+        # Event counts, handler latencies and server round trips for /metrics
+        instrument(session, name)
         register_function(session)
+        LISTENER_READY.set(1, action=name)
         logger.info(f"Listener '{name}' is waiting for events.")
-        session.event_hub.wait()
+        run_event_loop(session, name, catch_up=catch_up)
     except Exception as e:
         logger.error(f"Listener '{name}' failed: {e}", exc_info=True)
         sys.exit(1)
 
+def run_single_hub(actions_to_run):
+    """Runs every action in this process, fed by one shared event hub connection."""
+    logger.info("Starting single hub mode.")
+    session = ftrack_api.Session(
+        api_key=os.getenv('FTRACK_API_KEY'),
+        api_user=os.getenv('FTRACK_API_USER'),
+        server_url=os.getenv('FTRACK_SERVER'),
+        auto_connect_event_hub=True
+    )
+    router = EventRouter(session)
+    catch_ups = []
+    for register_function, name, catch_up in actions_to_run:
+        try:
+            # Each action gets its own API session; only the event hub is shared.
+            action_session = router.session_for(
+                name,
+                api_key=os.getenv('FTRACK_API_KEY'),
+                api_user=os.getenv('FTRACK_API_USER'),
+                server_url=os.getenv('FTRACK_SERVER'),
+            )
+            instrument(action_session, name)
+            register_function(action_session)
+            LISTENER_READY.set(1, action=name)
+            logger.info(f"Action '{name}' registered on the shared event hub.")
+            if catch_up:
+                catch_ups.append(catch_up)
+        except Exception as e:
+            logger.error(f"Action '{name}' failed to register: {e}", exc_info=True)
+            LISTENER_READY.set(0, action=name)
+
+    def catch_up_all(since):
+        for catch_up in catch_ups:
+            catch_up(since)
+
+    run_event_loop(session, "Single Hub", catch_up=catch_up_all)
+
 # --- Main execution block ---
 if __name__ == '__main__':
     logger.info("Launching ftrack action server 1.0 ...")
 
-    # A list of all actions to run
+    # A list of all actions to run: register function, name and the catch-up
+    # run after an event hub outage (None for actions launched by users)
     actions_to_run = [
-        (register_shot_automation, "Shot Creation Automation"),
-        (register_project_copy, "Project Copy Action"),
-        # (register_undark_pbv_sync, "Undark PBV Sync Listener")
-        (register_daily_internal, "Daily Internal"),
-        (register_client_review, "Client Review"),
+        (register_shot_automation, "Shot Creation Automation", catch_up_shot_automation),
+        (register_project_copy, "Project Copy Action", None),
+        # (register_undark_pbv_sync, "Undark PBV Sync Listener", None)
+        (register_daily_internal, "Daily Internal", None),
+        (register_client_review, "Client Review", None),
     ]
     logger.info(f"Actions to run: {actions_to_run}")
 
-    processes = []
-    for register_func, name in actions_to_run:
-        process = Process(target=run_listener, args=(register_func, name))
-        processes.append(process)
-        process.start()
+    if SINGLE_HUB:
+        listeners = [Listener("Single Hub", run_single_hub, (actions_to_run,))]
+    else:
+        listeners = [
+            Listener(name, run_listener, (register_func, name, catch_up))
+            for register_func, name, catch_up in actions_to_run
+        ]
+
+    # Latest metrics snapshot of every listener process
+    collector = MetricsCollector(multiprocessing.Queue(maxsize=1000))
+    collector.start()
 
-    logger.info(f"{len(processes)} action processes have started.")
+    # Restarts listeners that exit, with backoff and a crash loop limit
+    supervisor = Supervisor(listeners, metrics_queue=collector.queue)
+    supervisor.start()
+
+    # /healthz, /readyz and /metrics on the port published by docker-compose
+    health_server = HealthServer(supervisor, collector)
+    health_server.start()
 
     # Graceful shutdown handler
     def shutdown(signum, frame):
         logger.info("Shutdown signal received. Terminating processes...")
-        for p in processes:
-            p.terminate()
-            p.join()
-        logger.info("Shutdown complete.")
+        health_server.stop()
+        supervisor.stop()
+        logger.info(f"Shutdown complete. Restart counts: {supervisor.restart_counts()}")
         sys.exit(0)
 
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
 
-    for p in processes:
-        p.join()
\ No newline at end of file
+    supervisor.run()
+    sys.exit(1)